@@ -1,16 +1,23 @@
 from django.contrib import admin
-from .models import Post, Category, Comment, Profile
+from .models import Post, Category, Comment, Job, OutboundEmail, Profile
 
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ["name", "slug"]
+    list_display = ["name", "slug", "published_post_count"]
     prepopulated_fields = {"slug": ("name",)}
 
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
-    list_display = ["title", "author", "category", "status", "created_at"]
+    list_display = [
+        "title",
+        "author",
+        "category",
+        "status",
+        "comment_count",
+        "created_at",
+    ]
     list_filter = ["status", "category", "created_at"]
     search_fields = ["title", "content"]
     prepopulated_fields = {"slug": ("title",)}
@@ -25,4 +32,18 @@ class CommentAdmin(admin.ModelAdmin):
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
-    list_display = ["user", "location"]
\ No newline at end of file
+    list_display = ["user", "location"]
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ["task", "status", "attempts", "run_after", "locked_by"]
+    list_filter = ["status", "task"]
+    readonly_fields = ["last_error"]
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ["subject", "recipients", "status", "attempts", "next_attempt_at"]
+    list_filter = ["status"]
+    readonly_fields = ["message", "last_error"]
@@ -6,4 +6,5 @@ class BlogConfig(AppConfig):
     name = "blog"
 
     def ready(self):
-        from . import signals #noqa: F401
\ No newline at end of file
+        # ``mail`` registers its background job.
+        from . import mail, signals  # noqa: F401
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""The static asset pipeline.
+
+``collectstatic`` copies ``static/`` to ``STATIC_ROOT``; ``MinifiedStorage``
+then minifies the collected CSS and JS in place before WhiteNoise hashes
+them and writes the ``.gz``/``.br`` variants next to each file. Hashed
+names change with the content, so WhiteNoise serves them as ``immutable``.
+
+``preload_links()`` is the ``Link`` header ``AssetPreloadMiddleware`` adds
+to HTML pages, so that the render-blocking assets every page in
+``layout.html`` needs are requested before the markup that names them
+arrives (a CDN in front turns it into a ``103 Early Hints`` response).
+"""
+
+from django.conf import settings
+from django.templatetags.static import static
+from rcssmin import cssmin
+from rjsmin import jsmin
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+MINIFIERS = {".css": cssmin, ".js": jsmin}
+# Third-party files are shipped minified (or are not ours to rewrite).
+SKIP_PREFIXES = ("admin/", "cloudinary/")
+# (path, "as" destination) for every page; see layout.html.
+PRELOAD_ASSETS = [("css/style.css", "style"), ("js/app.js", "script")]
+
+
+def minify(name, text):
+    """``text`` minified by the minifier for ``name``'s extension."""
+    suffix = "." + name.rsplit(".", 1)[-1]
+    return MINIFIERS[suffix](text)
+
+
+def is_minifiable(name):
+    return (
+        name.endswith(tuple(MINIFIERS))
+        and not name.startswith(SKIP_PREFIXES)
+        and ".min." not in name
+    )
+
+
+class MinifiedStorage(CompressedManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            for name in paths:
+                if is_minifiable(name):
+                    self.minify_file(name)
+                    # Hash (and compress) the minified copy, not the source.
+                    paths[name] = (self, name)
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+
+    def minify_file(self, name):
+        path = self.path(name)
+        with open(path, encoding="utf-8") as fh:
+            source = fh.read()
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(minify(name, source))
+
+
+def preload_links(assets=None):
+    """``Link`` header value preloading ``assets`` by their hashed URLs."""
+    if assets is None:
+        assets = getattr(settings, "BLOG_PRELOAD_ASSETS", PRELOAD_ASSETS)
+    return ", ".join(
+        f"<{static(path)}>; rel=preload; as={destination}"
+        for path, destination in assets
+    )
@@ -0,0 +1,169 @@
+"""Cache helpers shared by the blog's cached fragments and pages.
+
+Invalidation is done with version counters rather than by deleting keys:
+anything derived from, say, a category embeds ``version("category", pk)`` in
+its cache key, and the signal handlers bump that counter when the category
+changes. Old entries simply stop being addressed and age out.
+"""
+
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import timezone
+
+from . import replicas
+
+VERSION_PREFIX = "blog:v"
+STATS_PREFIX = "blog:stats"
+PAGE_PREFIX = "blog:page"
+PAGE_CACHE_TIMEOUT = 60 * 10
+# Global scopes a public page can depend on; any write to one of them
+# retires every cached page.
+PAGE_SCOPES = ["posts", "comments", "categories", "authors"]
+
+
+def _version_key(scope, pk=None):
+    if pk is None:
+        return f"{VERSION_PREFIX}:{scope}"
+    return f"{VERSION_PREFIX}:{scope}:{pk}"
+
+
+def version(scope, pk=None):
+    return cache.get_or_set(_version_key(scope, pk), 1, None)
+
+
+def versions(pairs):
+    """Fetch many ``(scope, pk)`` versions in one cache round-trip."""
+    keys = {pair: _version_key(*pair) for pair in pairs}
+    found = cache.get_many(keys.values())
+    missing = {key: 1 for key in keys.values() if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return {pair: found[key] for pair, key in keys.items()}
+
+
+def bump(scope, pk=None):
+    key = _version_key(scope, pk)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Unknown key: start above the implicit default of 1.
+        cache.set(key, 2, None)
+
+
+def timeout_until(moment, default):
+    """``default`` seconds, shortened so an entry expires by ``moment``.
+
+    Used for anything that depends on ``PostQuerySet.published()``: a
+    scheduled post goes live without a write, so nothing would bump a
+    version for it.
+    """
+    if moment is None:
+        return default
+    remaining = int((moment - timezone.now()).total_seconds()) + 1
+    return max(1, min(default, remaining))
+
+
+def record(name, hits=0, misses=0):
+    """Accumulate hit/miss counters for ``name`` (shared across workers)."""
+    for kind, amount in (("hits", hits), ("misses", misses)):
+        if not amount:
+            continue
+        key = f"{STATS_PREFIX}:{name}:{kind}"
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            cache.set(key, amount, None)
+
+
+def stats(name):
+    hits = cache.get(f"{STATS_PREFIX}:{name}:hits", 0)
+    misses = cache.get(f"{STATS_PREFIX}:{name}:misses", 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / total if total else None,
+    }
+
+
+def reset_stats(name):
+    cache.delete_many(
+        [f"{STATS_PREFIX}:{name}:hits", f"{STATS_PREFIX}:{name}:misses"]
+    )
+
+
+def _page_cacheable(request):
+    if request.method not in {"GET", "HEAD"}:
+        return False
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        # Anonymous; looking at the user would load the session.
+        return not len(messages.get_messages(request))
+    if request.user.is_authenticated:
+        # Logged-in users see drafts, previews and per-user controls.
+        return False
+    # A pending flash message is rendered into the page and then consumed.
+    return not len(messages.get_messages(request))
+
+
+def _page_key(request, stamp):
+    url = request.build_absolute_uri()
+    location = hashlib.md5(url.encode(), usedforsecurity=False).hexdigest()
+    return ":".join(
+        [PAGE_PREFIX, *(str(stamp[(s, None)]) for s in PAGE_SCOPES), location]
+    )
+
+
+def _page_response(cached):
+    content, content_type = cached
+    return HttpResponse(content, content_type=content_type)
+
+
+def _page_storable(response):
+    # Never cache a response that sets cookies (CSRF, session, ...).
+    return response.status_code == 200 and not response.cookies
+
+
+def cache_public_page(view):
+    """Serve anonymous GETs of ``view`` from a full-page cache.
+
+    Entries are keyed on the page scope versions, so any post, comment,
+    category or author write retires them, and they expire by the next
+    scheduled publication so future-dated posts appear on time. A miss is
+    rendered from the primary, never from a replica that may not have the
+    write yet.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not _page_cacheable(request):
+            return view(request, *args, **kwargs)
+
+        stamp = versions([(scope, None) for scope in PAGE_SCOPES])
+        key = _page_key(request, stamp)
+        cached = cache.get(key)
+        if cached is not None:
+            record("page", hits=1)
+            return _page_response(cached)
+
+        record("page", misses=1)
+        with replicas.primary_reads():
+            response = view(request, *args, **kwargs)
+            if _page_storable(response):
+                from .models import Post
+
+                timeout = timeout_until(
+                    Post.objects.next_publication(), PAGE_CACHE_TIMEOUT
+                )
+                cache.set(
+                    key, (response.content, response["Content-Type"]), timeout
+                )
+        return response
+
+    return wrapper
@@ -0,0 +1,204 @@
+"""Denormalized counters: ``Post.comment_count`` and
+``Category.published_post_count``.
+
+Listings read the columns instead of joining and counting. The signal
+handlers update them in the same transaction as the write that changes
+them (``Post.save``/``Comment.save`` are atomic, and deletes run inside
+the collector's transaction). To know what a save changed, each instance
+remembers where it was counted when it was loaded.
+
+A comment moves its post's count with ``F()``. A category counts the
+posts the public can see (``PostQuerySet.published``), which a scheduled
+post joins without a write: a post write recounts the categories it
+touches, and a job recounts a scheduled post's category when it goes
+live. Writes that skip signals (``QuerySet.update``, ``bulk_create``, raw
+SQL) can leave the columns off; ``manage.py reconcile_counters``
+recomputes them in batches.
+"""
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import caching, tasks
+
+# Where an instance was counted when it was loaded or last saved; missing
+# when unknown (e.g. the relevant fields were deferred).
+SNAPSHOT = "_counted_in"
+RECONCILE_BATCH_SIZE = 1000
+COUNTERS = ("comments", "posts")
+
+
+def _move(model, field, old, new):
+    """Take one from row ``old``, add one to row ``new`` (either may be None)."""
+    if old == new:
+        return
+    if old is not None:
+        # A drifted counter stays at 0 (the column is unsigned).
+        model._base_manager.filter(pk=old, **{f"{field}__gt": 0}).update(
+            **{field: F(field) - 1}
+        )
+    if new is not None:
+        model._base_manager.filter(pk=new).update(**{field: F(field) + 1})
+
+
+def recount_posts(category_ids):
+    """Recount ``published_post_count`` of some categories; returns rows fixed.
+
+    The rows are locked first, so the count, a statement of its own, sees
+    the posts of every writer that held them before.
+    """
+    from .models import Category
+
+    ids = sorted({pk for pk in category_ids if pk is not None})
+    if not ids:
+        return 0
+    _, field, rows = _sources()["posts"]
+    categories = Category._base_manager.filter(pk__in=ids)
+    with transaction.atomic():
+        list(categories.select_for_update().values_list("pk", flat=True))
+        return categories.exclude(**{field: actual_count(rows)}).update(
+            **{field: actual_count(rows)}
+        )
+
+
+@tasks.register
+def count_live_posts(category_ids):
+    """Recount categories once their scheduled posts have gone live."""
+    if recount_posts(category_ids):
+        caching.bump("categories")
+
+
+def schedule_recount(posts):
+    """Queue ``count_live_posts`` for the scheduled ones among ``posts``.
+
+    In eager mode (``BLOG_TASKS_EAGER``) the job runs at once, too early;
+    ``reconcile_counters`` catches up.
+    """
+    now = timezone.now()
+    due = {}
+    for post in posts:
+        if post.status == post.Status.PUBLISHED and post.published_at:
+            if post.published_at > now:
+                due.setdefault(post.published_at, set()).add(post.category_id)
+    for moment, ids in sorted(due.items()):
+        tasks.enqueue(
+            count_live_posts,
+            delay=(moment - now).total_seconds(),
+            category_ids=sorted(ids),
+        )
+
+
+def posts_created(posts):
+    """Count posts that were created without signals (``bulk_create``)."""
+    recount_posts(post.category_id for post in posts)
+    schedule_recount(posts)
+
+
+def remember(instance, field_names):
+    """Snapshot a freshly loaded instance (called from ``from_db``)."""
+    from .models import Comment, Post
+
+    if isinstance(instance, Post):
+        if "category_id" in field_names:
+            setattr(instance, SNAPSHOT, instance.category_id)
+    elif isinstance(instance, Comment) and "post_id" in field_names:
+        setattr(instance, SNAPSHOT, instance.post_id)
+
+
+def post_saving(post):
+    """Make sure the previous category is known before ``post`` is written."""
+    if hasattr(post, SNAPSHOT):
+        return
+    previous = None
+    if post.pk is not None:
+        manager = type(post)._base_manager
+        previous = (
+            manager.filter(pk=post.pk).values_list("category_id", flat=True).first()
+        )
+    setattr(post, SNAPSHOT, previous)
+
+
+def post_saved(post):
+    recount_posts([getattr(post, SNAPSHOT, None), post.category_id])
+    schedule_recount([post])
+    setattr(post, SNAPSHOT, post.category_id)
+
+
+def post_deleted(post):
+    recount_posts([getattr(post, SNAPSHOT, post.category_id)])
+
+
+def comment_saved(comment, created):
+    from .models import Post
+
+    old = None if created else getattr(comment, SNAPSHOT, comment.post_id)
+    _move(Post, "comment_count", old, comment.post_id)
+    setattr(comment, SNAPSHOT, comment.post_id)
+
+
+def comment_deleted(comment, origin=None):
+    from .models import Post
+
+    post_id = getattr(comment, SNAPSHOT, comment.post_id)
+    deleting_posts = getattr(origin, "model", type(origin)) is Post
+    if deleting_posts:
+        # A cascade from the post(s) themselves: every row being
+        # decremented is about to go too.
+        return
+    _move(Post, "comment_count", post_id, None)
+
+
+def _sources():
+    from .models import Category, Comment, Post
+
+    return {
+        "comments": (
+            Post,
+            "comment_count",
+            Comment.objects.filter(post=OuterRef("pk")).values("post"),
+        ),
+        "posts": (
+            Category,
+            "published_post_count",
+            Post.objects.filter(
+                category=OuterRef("pk"),
+                status=Post.Status.PUBLISHED,
+                published_at__lte=timezone.now(),
+            ).values("category"),
+        ),
+    }
+
+
+def actual_count(rows):
+    """``COUNT(*)`` of the correlated ``rows`` subquery, 0 when empty."""
+    counted = rows.order_by().annotate(n=Count("pk")).values("n")
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def reconcile(counter, batch_size=RECONCILE_BATCH_SIZE):
+    """Recompute one counter column in pk batches; yields rows fixed per batch.
+
+    Each batch is a single ``UPDATE`` of only the rows that drifted, in its
+    own transaction, so the table is never locked as a whole.
+    """
+    model, field, rows = _sources()[counter]
+    manager = model._base_manager
+    last = 0
+    while True:
+        ids = list(
+            manager.filter(pk__gt=last)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not ids:
+            return
+        last = ids[-1]
+        with transaction.atomic():
+            fixed = (
+                manager.filter(pk__in=ids)
+                .exclude(**{field: actual_count(rows)})
+                .update(**{field: actual_count(rows)})
+            )
+        yield fixed
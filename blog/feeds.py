@@ -1,27 +1,123 @@
+import hashlib
+
 from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
 from django.utils.feedgenerator import Atom1Feed
+from django.utils.http import http_date, quote_etag
 
+from . import caching, replicas
 from .models import Post
 
+FEED_ITEMS = 20
+FEED_CACHE_TIMEOUT = 60 * 60
+FEED_SUMMARY = {"last_modified": Max("updated_at"), "count": Count("pk")}
+
+
+def _feed_state(aggregate, next_publication):
+    state = dict(aggregate)
+    state["timeout"] = caching.timeout_until(next_publication, FEED_CACHE_TIMEOUT)
+    state["fingerprint"] = hashlib.md5(
+        f"{state['last_modified']}:{state['count']}".encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+    return state
+
+
+def feed_state():
+    """Latest ``updated_at`` and size of the published set, cached.
+
+    The entry is keyed on the global posts version (bumped by the post
+    signals) and expires when the next scheduled post goes live, so a
+    poll that finds nothing new costs one cache read. It is computed on
+    the primary: a replica may not have the post that bumped the version.
+    """
+    key = f"blog:feed:state:{caching.version('posts')}"
+    state = cache.get(key)
+    if state is None:
+        with replicas.primary_reads():
+            state = _feed_state(
+                Post.objects.published().order_by().aggregate(**FEED_SUMMARY),
+                Post.objects.next_publication(),
+            )
+        cache.set(key, state, state["timeout"])
+    return state
+
+
+def latest_items():
+    """The item list shared by the RSS and Atom feeds."""
+    state = feed_state()
+    key = f"blog:feed:items:{state['fingerprint']}"
+    items = cache.get(key)
+    if items is None:
+        with replicas.primary_reads():
+            items = list(Post.objects.published().for_listing()[:FEED_ITEMS])
+        cache.set(key, items, state["timeout"])
+    return items
 
-class LatestPostsRSS(Feed):
+
+class CachedFeedMixin:
+    """Serve a feed from the cache and answer conditional GETs with 304."""
+
+    def __call__(self, request, *args, **kwargs):
+        state = feed_state()
+        last_modified = state["last_modified"]
+        fingerprint = f"{type(self).__name__.lower()}-{state['fingerprint']}"
+        etag = quote_etag(fingerprint)
+        # HTTP dates have one-second resolution.
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            # Links in the feed are absolute, so the host is part of the key.
+            scheme = "https" if request.is_secure() else "http"
+            key = f"blog:feed:body:{fingerprint}:{scheme}:{request.get_host()}"
+            cached = cache.get(key)
+            if cached is None:
+                with replicas.primary_reads():
+                    response = super().__call__(request, *args, **kwargs)
+                cache.set(
+                    key,
+                    (response.content, response["Content-Type"]),
+                    state["timeout"],
+                )
+            else:
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+
+        response.headers["ETag"] = etag
+        if timestamp is not None:
+            response.headers["Last-Modified"] = http_date(timestamp)
+        return response
+
+
+class LatestPostsRSS(CachedFeedMixin, Feed):
     title = "Blurry Shady — Latest Posts"
     link = "/"
     description = "New posts from Blurry Shady"
 
     def items(self):
-        return Post.objects.published()[:20]
+        return latest_items()
 
     def item_title(self, item):
         return item.title
 
     def item_description(self, item):
-        # Simple preview; could striptags+truncate later.
-        return item.content[:400]
+        return item.excerpt
 
     def item_link(self, item):
         return item.get_absolute_url()
 
+    def item_pubdate(self, item):
+        return item.published_at
+
+    def item_updateddate(self, item):
+        return item.updated_at
+
 
 class LatestPostsAtom(LatestPostsRSS):
     feed_type = Atom1Feed
@@ -2,13 +2,49 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 
+from . import images
 from .models import Comment, Post, Profile
 
 
+IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp"}
+
+
+def check_image(f, *, max_bytes, max_pixels, label):
+    """Reject an uploaded image by byte size, type or pixel count."""
+    if f.size > max_bytes:
+        raise forms.ValidationError(
+            f"{label} must be {max_bytes // (1024 * 1024)}MB or less."
+        )
+    ct = getattr(f, "content_type", None)
+    if ct and ct not in IMAGE_TYPES:
+        raise forms.ValidationError("Use JPG, PNG, or WEBP.")
+    # ``ImageField`` has already parsed the header; refuse huge pixel
+    # counts now rather than when the image gets decoded.
+    image = getattr(f, "image", None)
+    if image is not None and image.width * image.height > max_pixels:
+        raise forms.ValidationError(f"{label} dimensions are too large.")
+
+
 class PostForm(forms.ModelForm):
     class Meta:
         model = Post
         fields = ["title", "content", "featured_image", "category", "status"]
+        help_texts = {
+            "featured_image": "JPG/PNG/WEBP, up to 10MB."
+        }
+
+    def clean_featured_image(self):
+        f = self.cleaned_data.get("featured_image")
+        # Only a new upload is a ``File`` with a content type; the current
+        # image comes back as the stored ``FieldFile``.
+        if f and hasattr(f, "content_type"):
+            check_image(
+                f,
+                max_bytes=10 * 1024 * 1024,
+                max_pixels=images.FEATURED_MAX_PIXELS,
+                label="Featured image",
+            )
+        return f
 
 
 class CommentForm(forms.ModelForm):
@@ -80,10 +116,10 @@ class ProfileForm(forms.ModelForm):
         f = self.cleaned_data.get("avatar")
         if not f:
             return f
-        if f.size > 2 * 1024 * 1024:  # 2MB
-            raise forms.ValidationError("Avatar must be 2MB or less.")
-        valid_types = {"image/jpeg", "image/png", "image/webp"}
-        ct = getattr(f, "content_type", None)
-        if ct and ct not in valid_types:
-            raise forms.ValidationError("Use JPG, PNG, or WEBP.")
+        check_image(
+            f,
+            max_bytes=2 * 1024 * 1024,
+            max_pixels=images.AVATAR_MAX_PIXELS,
+            label="Avatar",
+        )
         return f
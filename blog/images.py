@@ -0,0 +1,197 @@
+"""Responsive derivatives of uploaded images.
+
+Featured images are resized to a fixed set of widths and encoded as AVIF
+and WebP, with a JPEG fallback. Avatars are cropped square, re-encoded
+without their metadata (EXIF, GPS, ICC) and stored at a few display sizes;
+the re-encoded copy replaces the upload itself.
+
+Derivatives are written through the target storage (local filesystem or
+Cloudinary alike) under names derived from the source's content, and the
+result is recorded as a small JSON manifest on the model, which is what
+templates read. Regenerating for an unchanged source is a no-op.
+"""
+
+import hashlib
+import io
+import posixpath
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+WIDTHS = (320, 640, 960, 1280)
+WEBP_OPTIONS = {"quality": 75, "method": 4}
+JPEG_OPTIONS = {"quality": 80, "optimize": True}
+# Most to least preferred; browsers take the first <source> they support.
+FORMATS = (
+    ("image/avif", "AVIF", "avif", "avif", {"quality": 55}),
+    ("image/webp", "WEBP", "webp", "webp", WEBP_OPTIONS),
+    ("image/jpeg", "JPEG", None, "jpg", JPEG_OPTIONS),
+)
+FALLBACK_TYPE = "image/jpeg"
+DERIVATIVES_DIR = "derived"
+
+# Anything bigger is rejected from its header, before a pixel is decoded.
+FEATURED_MAX_PIXELS = 40_000_000
+AVATAR_MAX_PIXELS = 24_000_000
+AVATAR_CANONICAL_SIZE = 512
+# 2x the rendered sizes of the navbar, comment and profile-header avatars.
+AVATAR_SIZES = (48, 112, 192)
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def open_bounded(fh, max_pixels):
+    """``Image.open`` that refuses images over ``max_pixels``.
+
+    Pillow only reads the header here; the size check happens before any
+    decoding, so a decompression bomb costs a few bytes of I/O.
+    """
+    image = Image.open(fh)
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageTooLarge(f"{width}x{height} exceeds {max_pixels} pixels")
+    return image
+
+
+def available_formats():
+    """``FORMATS`` minus encoders this Pillow build lacks (JPEG always stays)."""
+    return [fmt for fmt in FORMATS if fmt[2] is None or features.check(fmt[2])]
+
+
+def derivative_name(source_name, digest, size, extension):
+    """Storage name for one derivative of ``source_name``.
+
+    ``digest`` identifies the content, so a re-upload under a reused name
+    never picks up (or later deletes) another file's derivatives.
+    """
+    directory, filename = posixpath.split(source_name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(
+        directory, DERIVATIVES_DIR, f"{stem}-{digest[:8]}-{size}w.{extension}"
+    )
+
+
+def target_widths(source_width, widths=WIDTHS):
+    """Widths to generate; never upscale, but always produce at least one."""
+    largest = min(source_width, max(widths))
+    return [*(w for w in widths if w < largest), largest]
+
+
+def _flatten(image):
+    if image.mode in {"RGBA", "LA"} or "transparency" in image.info:
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image.convert("RGBA"), mask=image.convert("RGBA"))
+        return background
+    return image.convert("RGB")
+
+
+def _encode(image, pil_format, options):
+    buffer = io.BytesIO()
+    image.save(buffer, format=pil_format, **options)
+    return buffer.getvalue()
+
+
+def _read(source):
+    data = source.read()
+    return data, hashlib.sha1(data, usedforsecurity=False).hexdigest()
+
+
+def _store(storage, name, encode):
+    if storage.exists(name):
+        return name
+    return storage.save(name, ContentFile(encode()))
+
+
+def generate_variants(source, source_name, storage, widths=WIDTHS):
+    """Write derivatives of the image in ``source`` and return their manifest.
+
+    ``source`` is an open binary file holding the image stored (or about
+    to be stored) as ``source_name`` in ``storage``. The manifest looks
+    like::
+
+        {"source": "posts/a.png", "width": 2000, "height": 1000,
+         "sources": {"image/webp": [{"name": ..., "width": 320,
+                                     "height": 160}, ...], ...}}
+
+    Derivatives that already exist in storage are not re-encoded. Raises
+    ``ImageTooLarge`` for more than ``FEATURED_MAX_PIXELS`` pixels.
+    """
+    data, digest = _read(source)
+    original = open_bounded(io.BytesIO(data), FEATURED_MAX_PIXELS)
+    original = _flatten(ImageOps.exif_transpose(original))
+
+    manifest = {
+        "source": source_name,
+        "width": original.width,
+        "height": original.height,
+        "sources": {},
+    }
+    for width in target_widths(original.width, widths):
+        height = max(1, round(original.height * width / original.width))
+        resized = []
+
+        def encode(pil_format, options):
+            if not resized:
+                resized.append(original.resize((width, height), Image.LANCZOS))
+            return _encode(resized[0], pil_format, options)
+
+        for mime, pil_format, _, extension, options in available_formats():
+            name = _store(
+                storage,
+                derivative_name(source_name, digest, width, extension),
+                lambda: encode(pil_format, options),
+            )
+            manifest["sources"].setdefault(mime, []).append(
+                {"name": name, "width": width, "height": height}
+            )
+    return manifest
+
+
+def generate_avatar_variants(source, source_name, storage):
+    """Square, metadata-free copies of an avatar at ``AVATAR_SIZES``.
+
+    Returns ``{"source": <canonical JPEG>, "sizes": {"48": name, ...}}``;
+    the caller points the avatar field at ``source``. JPEGs are decoded
+    straight at reduced scale (``draft``), so a large photo never expands
+    to full resolution in memory.
+    """
+    data, digest = _read(source)
+    image = open_bounded(io.BytesIO(data), AVATAR_MAX_PIXELS)
+    image.draft("RGB", (AVATAR_CANONICAL_SIZE, AVATAR_CANONICAL_SIZE))
+    image = _flatten(ImageOps.exif_transpose(image))
+
+    side = min(image.width, image.height, AVATAR_CANONICAL_SIZE)
+    square = ImageOps.fit(image, (side, side), Image.LANCZOS)
+
+    canonical = _store(
+        storage,
+        derivative_name(source_name, digest, side, "jpg"),
+        lambda: _encode(square, "JPEG", JPEG_OPTIONS),
+    )
+    sizes = {}
+    for size in target_widths(side, AVATAR_SIZES):
+        sizes[str(size)] = _store(
+            storage,
+            derivative_name(source_name, digest, size, "webp"),
+            lambda: _encode(
+                square.resize((size, size), Image.LANCZOS), "WEBP", WEBP_OPTIONS
+            ),
+        )
+    return {"source": canonical, "sizes": sizes}
+
+
+def manifest_names(manifest):
+    """Every derived file a manifest refers to (never a featured source)."""
+    names = set(manifest.get("sizes", {}).values())
+    if "sizes" in manifest:
+        names.add(manifest["source"])
+    for entries in manifest.get("sources", {}).values():
+        names.update(e["name"] for e in entries)
+    return names
+
+
+def is_current(field_file, manifest):
+    """Whether ``manifest`` was generated from ``field_file``'s current file."""
+    return bool(manifest) and manifest.get("source") == field_file.name
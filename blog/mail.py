@@ -0,0 +1,212 @@
+"""Outbound email through a database outbox.
+
+``OutboxEmailBackend`` is the site's ``EMAIL_BACKEND``: it stores each
+message as an ``OutboundEmail`` row and returns at once, so a slow or
+failing provider never holds up a request. ``deliver_outbox`` (run by the
+job queue and by ``manage.py send_outbox``) claims a batch, sends it over a
+single connection to ``OUTBOX_DELIVERY_BACKEND`` and retries failures with
+backoff; messages that keep failing are kept as ``failed`` (dead letters)
+until requeued.
+"""
+
+import base64
+import email
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db.models import Q
+from django.utils import timezone
+
+from . import tasks
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+SUBTYPES = ["content_subtype", "mixed_subtype", "alternative_subtype"]
+
+
+def _encode_content(content):
+    if isinstance(content, bytes):
+        return {"b64": base64.b64encode(content).decode()}
+    return content
+
+
+def _decode_content(content):
+    if isinstance(content, dict):
+        return base64.b64decode(content["b64"])
+    return content
+
+
+def serialize_message(message):
+    """A JSON-safe copy of an ``EmailMessage`` (including alternatives)."""
+    attachments = []
+    for attachment in message.attachments:
+        if isinstance(attachment, tuple):
+            filename, content, mimetype = attachment
+            attachments.append([filename, _encode_content(content), mimetype])
+        else:
+            # A ready-made MIME part.
+            attachments.append({"mime": _encode_content(attachment.as_bytes())})
+    return {
+        "subject": message.subject,
+        "body": message.body,
+        "from_email": message.from_email,
+        "to": list(message.to),
+        "cc": list(message.cc),
+        "bcc": list(message.bcc),
+        "reply_to": list(message.reply_to),
+        "headers": dict(message.extra_headers),
+        "alternatives": [
+            [_encode_content(content), mimetype]
+            for content, mimetype in getattr(message, "alternatives", [])
+        ],
+        "attachments": attachments,
+        "subtypes": {
+            name: getattr(message, name)
+            for name in SUBTYPES
+            if hasattr(message, name)
+        },
+    }
+
+
+def deserialize_message(data, connection=None):
+    message = EmailMultiAlternatives(
+        subject=data["subject"],
+        body=data["body"],
+        from_email=data["from_email"],
+        to=data["to"],
+        cc=data["cc"],
+        bcc=data["bcc"],
+        reply_to=data["reply_to"],
+        headers=data["headers"],
+        connection=connection,
+    )
+    for content, mimetype in data["alternatives"]:
+        message.attach_alternative(_decode_content(content), mimetype)
+    for attachment in data["attachments"]:
+        if isinstance(attachment, dict):
+            message.attach(
+                email.message_from_bytes(_decode_content(attachment["mime"]))
+            )
+        else:
+            filename, content, mimetype = attachment
+            message.attach(filename, _decode_content(content), mimetype)
+    for name, value in data.get("subtypes", {}).items():
+        setattr(message, name, value)
+    return message
+
+
+class OutboxEmailBackend(BaseEmailBackend):
+    """Queue messages in the database instead of sending them."""
+
+    def send_messages(self, email_messages):
+        from .models import OutboundEmail
+
+        rows = [
+            OutboundEmail(
+                subject=message.subject[:255],
+                recipients=", ".join(message.recipients())[:255],
+                message=serialize_message(message),
+            )
+            for message in email_messages
+            if message.recipients()
+        ]
+        if not rows:
+            return 0
+        try:
+            OutboundEmail.objects.bulk_create(rows)
+            tasks.enqueue(deliver_outbox)
+        except Exception:
+            if not self.fail_silently:
+                raise
+            return 0
+        return len(rows)
+
+
+def claim_batch(size=BATCH_SIZE):
+    """Lock up to ``size`` due messages for this caller and return them.
+
+    Rows are taken with a conditional ``UPDATE`` tagged with a one-off
+    token, so concurrent senders never get the same message.
+    """
+    from .models import OutboundEmail
+
+    now = timezone.now()
+    token = f"{tasks.worker_name()}:{uuid.uuid4().hex[:8]}"
+    due = OutboundEmail.objects.filter(
+        Q(status=OutboundEmail.Status.PENDING, next_attempt_at__lte=now)
+        # A sender that died mid-batch; at-least-once beats never.
+        | Q(
+            status=OutboundEmail.Status.SENDING,
+            locked_at__lt=now - tasks.LOCK_TIMEOUT,
+        )
+    )
+    candidates = list(
+        due.order_by("next_attempt_at", "pk").values_list("pk", flat=True)[:size]
+    )
+    if not candidates:
+        return []
+    due.filter(pk__in=candidates).update(
+        status=OutboundEmail.Status.SENDING, locked_by=token, locked_at=now
+    )
+    return list(OutboundEmail.objects.filter(locked_by=token).order_by("pk"))
+
+
+def _failed(row, error):
+    from .models import OutboundEmail
+
+    attempts = row.attempts + 1
+    update = {"attempts": attempts, "last_error": error, "locked_by": ""}
+    if attempts >= row.max_attempts:
+        update["status"] = OutboundEmail.Status.FAILED
+    else:
+        update["status"] = OutboundEmail.Status.PENDING
+        update["next_attempt_at"] = timezone.now() + timedelta(
+            seconds=tasks.backoff(attempts)
+        )
+    OutboundEmail.objects.filter(pk=row.pk).update(**update)
+
+
+def send_batch(rows):
+    """Send claimed ``rows`` over one provider connection; returns sent count."""
+    from .models import OutboundEmail
+
+    if not rows:
+        return 0
+    connection = get_connection(settings.OUTBOX_DELIVERY_BACKEND)
+    sent = []
+    try:
+        connection.open()
+    except Exception as exc:
+        logger.exception("Could not connect to the email provider")
+        for row in rows:
+            _failed(row, repr(exc))
+        return 0
+    try:
+        for row in rows:
+            try:
+                message = deserialize_message(row.message, connection=connection)
+                if not connection.send_messages([message]):
+                    raise RuntimeError("Provider accepted no messages")
+            except Exception as exc:
+                logger.warning("Sending email %s failed: %r", row.pk, exc)
+                _failed(row, repr(exc))
+            else:
+                sent.append(row.pk)
+    finally:
+        connection.close()
+    OutboundEmail.objects.filter(pk__in=sent).delete()
+    return len(sent)
+
+
+@tasks.register
+def deliver_outbox(batch_size=BATCH_SIZE):
+    """Send everything that is due, one batch (and connection) at a time."""
+    total = 0
+    while rows := claim_batch(batch_size):
+        total += send_batch(rows)
+    return total
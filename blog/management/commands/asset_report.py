@@ -0,0 +1,67 @@
+import gzip
+from pathlib import Path
+
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import assets
+
+
+def _size(path):
+    path = Path(path)
+    return path.stat().st_size if path.exists() else 0
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the bytes of the assets every page loads as written in "
+        "static/ and as served after collectstatic (minified, gzip, Brotli)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths",
+            nargs="*",
+            help="Static paths (default: the preloaded layout assets).",
+        )
+
+    def handle(self, *args, **options):
+        paths = options["paths"] or [p for p, _ in assets.PRELOAD_ASSETS]
+        self.stdout.write(
+            f"{'asset':<28} {'source':>8} {'src gz':>8} {'minified':>8} "
+            f"{'gzip':>8} {'brotli':>8}"
+        )
+        totals = [0] * 5
+        before = after = 0
+        for path in paths:
+            source, source_gz, minified, gz, br = row = self.sizes(path)
+            totals = [t + n for t, n in zip(totals, row)]
+            # What a browser accepting gzip and Brotli downloads. Formats
+            # that are already compressed (images) are sent as they are.
+            before += source_gz if gz else source
+            after += br or gz or minified
+            self.stdout.write(f"{path:<28} " + " ".join(f"{n:>8}" for n in row))
+        self.stdout.write(f"{'total':<28} " + " ".join(f"{n:>8}" for n in totals))
+        if before:
+            self.stdout.write(
+                f"Transferred: {before} B before (source, gzipped) -> {after} B "
+                f"(minified, Brotli), {1 - after / before:.0%} less."
+            )
+
+    def sizes(self, path):
+        source = finders.find(path)
+        if not source:
+            raise CommandError(f"{path} is not a static file.")
+        try:
+            served = staticfiles_storage.path(staticfiles_storage.stored_name(path))
+        except ValueError:
+            raise CommandError("Run collectstatic first.")
+        raw = Path(source).read_bytes()
+        return [
+            len(raw),
+            len(gzip.compress(raw)),
+            _size(served),
+            _size(f"{served}.gz"),
+            _size(f"{served}.br"),
+        ]
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog import caching
+from blog.models import Post, post_summary_fields
+
+SUMMARY_FIELDS = ["excerpt", "meta_description", "word_count"]
+
+
+class Command(BaseCommand):
+    help = "Recompute Post.excerpt, meta_description and word_count."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--only-missing",
+            action="store_true",
+            help="Only fill posts whose excerpt is still empty.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        posts = Post.objects.only("pk", "content", *SUMMARY_FIELDS).order_by("pk")
+        if options["only_missing"]:
+            posts = posts.filter(excerpt="")
+
+        total = 0
+        batch = []
+        for post in posts.iterator(chunk_size=batch_size):
+            fields = post_summary_fields(post.content)
+            if all(getattr(post, f) == v for f, v in fields.items()):
+                continue
+            for field, value in fields.items():
+                setattr(post, field, value)
+            batch.append(post)
+            if len(batch) >= batch_size:
+                total += self._flush(batch)
+                batch = []
+        total += self._flush(batch)
+        if total:
+            caching.bump("posts")
+        self.stdout.write(self.style.SUCCESS(f"Updated {total} posts."))
+
+    def _flush(self, batch):
+        with transaction.atomic():
+            Post.objects.bulk_update(batch, SUMMARY_FIELDS)
+        # ``bulk_update`` leaves ``updated_at`` alone, so cached cards
+        # would keep the old excerpt.
+        for post in batch:
+            caching.bump("post", post.pk)
+        return len(batch)
@@ -0,0 +1,87 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure how long threads wait for a database connection under "
+        "concurrent load, with the pool configured in settings (run with "
+        "DB_POOL=false to compare against opening connections directly)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads", type=int, default=16, help="Concurrent clients."
+        )
+        parser.add_argument(
+            "--checkouts", type=int, default=100, help="Checkouts per thread."
+        )
+        parser.add_argument(
+            "--hold-ms",
+            type=float,
+            default=5.0,
+            help="How long each checkout keeps its connection (a request).",
+        )
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        alias = options["database"]
+        hold = options["hold_ms"] / 1000
+        lock = threading.Lock()
+        waits = []
+
+        def client(_):
+            # Each thread has its own DatabaseWrapper, as request threads do.
+            connection = connections[alias]
+            for _ in range(options["checkouts"]):
+                began = time.perf_counter()
+                connection.ensure_connection()
+                waited = time.perf_counter() - began
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                time.sleep(hold)
+                # What request_finished does: with a pool, the connection
+                # goes back to it; otherwise it is kept for CONN_MAX_AGE.
+                connection.close_if_unusable_or_obsolete()
+                with lock:
+                    waits.append(waited * 1000)
+
+        began = time.monotonic()
+        with ThreadPoolExecutor(options["threads"]) as executor:
+            list(executor.map(client, range(options["threads"])))
+        elapsed = time.monotonic() - began
+
+        connection = connections[alias]
+        pool = getattr(connection, "pool", None)
+        self.stdout.write(
+            f"{'pool' if pool else 'no pool'}: {len(waits)} checkouts by "
+            f"{options['threads']} threads in {elapsed:.1f}s"
+        )
+        self.stdout.write(
+            f"checkout ms: p50 {_percentile(waits, 0.5):.2f}  "
+            f"p95 {_percentile(waits, 0.95):.2f}  "
+            f"p99 {_percentile(waits, 0.99):.2f}  "
+            f"max {max(waits):.2f}  mean {statistics.fmean(waits):.2f}"
+        )
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT count(*) FROM pg_stat_activity "
+                    "WHERE datname = current_database()"
+                )
+                self.stdout.write(f"server connections: {cursor.fetchone()[0]}")
+        if pool:
+            stats = pool.get_stats()
+            self.stdout.write(
+                "pool: " + ", ".join(f"{k}={v}" for k, v in sorted(stats.items()))
+            )
@@ -0,0 +1,257 @@
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.models import Category, Post
+
+SERVERS = {
+    "wsgi": ["personalblog.wsgi:application"],
+    "asgi": [
+        "personalblog.asgi:application",
+        "--worker-class",
+        "uvicorn_worker.UvicornWorker",
+    ],
+}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _children(pid):
+    found = []
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        # The command name may contain spaces; the ppid follows its ")".
+        if int(stat.rsplit(")", 1)[1].split()[1]) == pid:
+            found.append(int(entry.name))
+    return found
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare throughput and latency of the WSGI (sync gunicorn) and "
+        "ASGI (uvicorn worker) deployments against the current database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--server",
+            choices=sorted(SERVERS),
+            nargs="+",
+            default=sorted(SERVERS, reverse=True),
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=2,
+            help="Worker processes per server (ignored with --memory-budget).",
+        )
+        parser.add_argument(
+            "--memory-budget",
+            type=int,
+            metavar="MB",
+            help="Size each server to as many workers as fit in this much "
+            "RSS, measured from a one-worker probe.",
+        )
+        parser.add_argument(
+            "--threads", type=int, default=1, help="Threads per WSGI worker."
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=32, help="Concurrent clients."
+        )
+        parser.add_argument("--duration", type=float, default=15.0)
+        parser.add_argument("--warmup", type=float, default=3.0)
+        parser.add_argument(
+            "--path",
+            action="append",
+            dest="paths",
+            help="Path to request (repeatable); defaults to one of each "
+            "public read view.",
+        )
+        parser.add_argument("--json", help="Also write the results here.")
+
+    def handle(self, *args, **options):
+        if not Path("/proc").is_dir():
+            raise CommandError("Memory is read from /proc; Linux only.")
+        paths = options["paths"] or self.default_paths()
+        self.stdout.write(f"Paths: {', '.join(paths)}")
+
+        results = []
+        for kind in options["server"]:
+            workers = options["workers"]
+            if options["memory_budget"]:
+                probe = self.run(kind, 1, paths, options, duration=0)
+                per_worker = probe["rss_mb"]
+                workers = max(1, int(options["memory_budget"] // per_worker))
+                self.stdout.write(
+                    f"{kind}: {per_worker:.0f} MB per worker -> {workers} workers"
+                )
+            results.append(self.run(kind, workers, paths, options))
+
+        self.stdout.write(
+            f"{'server':<6} {'workers':>7} {'rss MB':>7} {'requests':>8} "
+            f"{'errors':>6} {'req/s':>8} {'p50 ms':>7} {'p99 ms':>7}"
+        )
+        for r in results:
+            self.stdout.write(
+                f"{r['server']:<6} {r['workers']:>7} {r['rss_mb']:>7.0f} "
+                f"{r['requests']:>8} {r['errors']:>6} {r['rps']:>8.1f} "
+                f"{r['p50_ms'] or 0:>7.1f} {r['p99_ms'] or 0:>7.1f}"
+            )
+        if options["json"]:
+            with open(options["json"], "w") as fh:
+                json.dump({"paths": paths, "results": results}, fh, indent=2)
+
+    def default_paths(self):
+        paths = ["/", "/feed/"]
+        post = Post.objects.published().select_related("author").first()
+        if post:
+            paths.append(post.get_absolute_url())
+            paths.append(f"/u/{post.author.username}/")
+        category = Category.objects.first()
+        if category:
+            paths.append(category.get_absolute_url())
+        return paths
+
+    def run(self, kind, workers, paths, options, duration=None):
+        port = _free_port()
+        command = [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            *SERVERS[kind],
+            "--bind",
+            f"127.0.0.1:{port}",
+            "--workers",
+            str(workers),
+            # Workers report their own SIGTERM at "error" on shutdown.
+            "--log-level",
+            "critical",
+        ]
+        if kind == "wsgi":
+            command += ["--threads", str(options["threads"])]
+        env = {**os.environ, "ALLOWED_HOSTS": "127.0.0.1"}
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env)
+        try:
+            self.wait_until_up(port, server, paths[0])
+            self.load(port, paths, options["concurrency"], options["warmup"])
+            rss_kb = sum(_rss_kb(pid) for pid in _children(server.pid))
+            if duration is None:
+                duration = options["duration"]
+            latencies, errors, elapsed = self.load(
+                port, paths, options["concurrency"], duration
+            )
+            if server.poll() is not None:
+                raise CommandError(f"The {kind} server died during the run.")
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+        return {
+            "server": kind,
+            "workers": workers,
+            # All workers together; the master process is left out.
+            "rss_mb": rss_kb / 1024,
+            "requests": len(latencies),
+            "errors": errors,
+            "rps": len(latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": _percentile(latencies, 0.50),
+            "p99_ms": _percentile(latencies, 0.99),
+        }
+
+    def wait_until_up(self, port, server, path, timeout=30):
+        """Wait for a worker (not just the master's socket) to answer."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError("The server exited during startup.")
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            try:
+                conn.request("GET", path)
+                status = conn.getresponse().status
+            except (OSError, http.client.HTTPException):
+                time.sleep(0.2)
+                continue
+            finally:
+                conn.close()
+            if status != 200:
+                raise CommandError(f"GET {path} answered {status}.")
+            return
+        raise CommandError(f"No answer on port {port} after {timeout}s.")
+
+    def load(self, port, paths, concurrency, duration):
+        """Keep ``concurrency`` keep-alive clients busy for ``duration`` s."""
+        if duration <= 0:
+            return [], 0, 0.0
+        lock = threading.Lock()
+        latencies = []
+        errors = 0
+        deadline = time.monotonic() + duration
+
+        def client(offset):
+            nonlocal errors
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            n = offset
+            while time.monotonic() < deadline:
+                path = paths[n % len(paths)]
+                n += 1
+                start = time.perf_counter()
+                try:
+                    conn.request("GET", path)
+                    response = conn.getresponse()
+                    response.read()
+                    ok = response.status == 200
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    conn = http.client.HTTPConnection(
+                        "127.0.0.1", port, timeout=30
+                    )
+                    ok = False
+                took = (time.perf_counter() - start) * 1000
+                with lock:
+                    if ok:
+                        latencies.append(took)
+                    else:
+                        errors += 1
+            conn.close()
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(client, range(concurrency)))
+        return latencies, errors, time.monotonic() - start
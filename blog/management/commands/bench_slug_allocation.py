@@ -0,0 +1,75 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from blog.models import Category, Post
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time Post slug allocation against a growing number of existing "
+        "collisions. Runs inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--collisions",
+            type=int,
+            nargs="+",
+            default=[0, 10, 100, 1000, 10000],
+        )
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'collisions':>10}  {'queries':>7}  {'ms/alloc':>9}")
+        try:
+            with transaction.atomic():
+                self._run(sorted(options["collisions"]), options["repeat"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _run(self, sizes, repeat):
+        author = get_user_model().objects.create(username="bench-slug-author")
+        category = Category.objects.create(name="bench-slugs", slug="bench-slugs")
+        title = "Weekly notes benchmark"
+        existing = 0
+
+        for size in sizes:
+            if size > existing:
+                Post.objects.bulk_create(
+                    [
+                        Post(
+                            title=title,
+                            slug=(
+                                "weekly-notes-benchmark"
+                                if n == 1
+                                else f"weekly-notes-benchmark-{n}"
+                            ),
+                            content="",
+                            author=author,
+                            category=category,
+                        )
+                        for n in range(existing + 1, size + 1)
+                    ],
+                    batch_size=1000,
+                )
+                existing = size
+
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    Post.objects.allocate_slug(title)
+                elapsed = time.perf_counter() - start
+
+            self.stdout.write(
+                f"{size:>10}  {len(ctx.captured_queries) // repeat:>7}  "
+                f"{elapsed / repeat * 1000:>9.3f}"
+            )
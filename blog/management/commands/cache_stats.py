@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from blog import caching
+
+TRACKED = ["post_card", "page"]
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters for the blog's cached fragments and pages."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Zero the counters after printing them.",
+        )
+
+    def handle(self, *args, **options):
+        for name in TRACKED:
+            data = caching.stats(name)
+            rate = data["hit_rate"]
+            rate = "n/a" if rate is None else f"{rate:.1%}"
+            self.stdout.write(
+                f"{name}: {data['hits']} hits, {data['misses']} misses "
+                f"(hit rate {rate})"
+            )
+            if options["reset"]:
+                caching.reset_stats(name)
@@ -0,0 +1,86 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from blog import backup
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream users, categories, profiles, posts and comments to a "
+        "gzipped JSON Lines file; restore it with restore_blog."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-o",
+            "--output",
+            help="File to write (default: blog-<UTC time>.jsonl.gz).",
+        )
+        parser.add_argument(
+            "--since",
+            help="Only rows changed at or after this ISO 8601 time.",
+        )
+        parser.add_argument(
+            "--watermark",
+            help="File holding the time of the last export. With it, only "
+            "what changed since is exported, and the file is moved forward "
+            "once this export is written.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=backup.CHUNK_SIZE)
+        parser.add_argument(
+            "--compress-level",
+            type=int,
+            default=backup.COMPRESS_LEVEL,
+            choices=range(1, 10),
+            metavar="1-9",
+        )
+
+    def handle(self, *args, **options):
+        # Taken before reading, so rows changed during the export are
+        # exported again next time rather than missed.
+        started_at = timezone.now()
+        since = self.since(options)
+        output = Path(
+            options["output"]
+            or f"blog-{started_at.strftime('%Y%m%dT%H%M%SZ')}.jsonl.gz"
+        )
+        partial = output.with_name(output.name + ".partial")
+
+        began = time.monotonic()
+        written = backup.export(
+            partial,
+            since=since,
+            chunk_size=options["chunk_size"],
+            compresslevel=options["compress_level"],
+        )
+        partial.replace(output)
+        if options["watermark"]:
+            Path(options["watermark"]).write_text(started_at.isoformat() + "\n")
+
+        for label, n in written.items():
+            self.stdout.write(f"{label}: {n}")
+        scope = f"changes since {since.isoformat()}" if since else "everything"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Exported {scope} to {output} ({output.stat().st_size} bytes) "
+                f"in {time.monotonic() - began:.1f}s."
+            )
+        )
+
+    def since(self, options):
+        value = options["since"]
+        if value is None and options["watermark"]:
+            path = Path(options["watermark"])
+            value = path.read_text().strip() if path.exists() else None
+        if value is None:
+            return None
+        moment = parse_datetime(value)
+        if moment is None:
+            raise CommandError(f"{value!r} is not an ISO 8601 date and time.")
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
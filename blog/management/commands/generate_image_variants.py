@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from blog import caching
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = "Create responsive derivatives for posts' featured images."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Rebuild the manifest even when it looks current.",
+        )
+
+    def handle(self, *args, **options):
+        posts = (
+            Post.objects.exclude(featured_image="")
+            .exclude(featured_image__isnull=True)
+            .only("pk", "featured_image", "image_variants")
+            .order_by("pk")
+        )
+        updated = 0
+        for post in posts.iterator(chunk_size=100):
+            if options["force"]:
+                post.image_variants = {}
+            if post.update_image_variants():
+                caching.bump("post", post.pk)
+                updated += 1
+        if updated:
+            caching.bump("posts")
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated} posts."))
@@ -0,0 +1,412 @@
+import gzip
+import json
+import re
+import time
+from collections import Counter
+from datetime import datetime, time as day_start
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.text import slugify
+
+from blog import caching, counters, search
+from blog.models import Category, Post, post_summary_fields, slug_base
+
+FRONT_MATTER = re.compile(r"\A---[ \t]*\r?\n(.*?)\r?\n---[ \t]*(?:\r?\n|\Z)", re.S)
+TITLE_LENGTH = Post._meta.get_field("title").max_length
+CATEGORY_NAME_LENGTH = Category._meta.get_field("name").max_length
+# Examples of skipped records to print; the rest are only counted.
+SHOW_SKIPPED = 10
+
+
+def parse_markdown(text):
+    """``(front matter, body)`` of a Markdown file.
+
+    Front matter is the flat ``key: value`` block between ``---`` lines that
+    Jekyll and Hugo write; values may be quoted, nested YAML is ignored.
+    """
+    match = FRONT_MATTER.match(text)
+    if not match:
+        return {}, text
+    meta = {}
+    for line in match[1].splitlines():
+        key, sep, value = line.partition(":")
+        if not sep or line[:1] in (" ", "\t", "#", "-"):
+            continue
+        value = value.strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+            value = value[1:-1]
+        meta[key.strip().lower()] = value
+    return meta, text[match.end():].lstrip("\r\n")
+
+
+def parse_moment(value):
+    """An aware datetime from an ISO date or datetime, or ``None``."""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        moment = value
+    else:
+        value = str(value).strip()
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(f"bad date {value!r}")
+            moment = datetime.combine(day, day_start())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def is_true(value):
+    return str(value).strip().lower() in {"1", "true", "yes", "on"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Import posts from a directory of Markdown files with front matter "
+        "or from a JSON Lines file (optionally gzipped), in bulk batches. "
+        "An interrupted import resumes from its checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "source",
+            help="Directory of .md files (searched recursively, imported in "
+            "path order) or a .jsonl/.jsonl.gz file with one post per line.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--author",
+            help="Username for posts without a (known) author; otherwise "
+            "they are skipped.",
+        )
+        parser.add_argument(
+            "--category",
+            help="Category for posts without one (created if missing).",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="Progress file (default: <source>.import-checkpoint).",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignore the checkpoint and start from the first record.",
+        )
+
+    def handle(self, *args, **options):
+        source = Path(options["source"])
+        if not source.exists():
+            raise CommandError(f"{source} does not exist.")
+        checkpoint = Path(
+            options["checkpoint"] or f"{str(source).rstrip('/')}.import-checkpoint"
+        )
+        done = 0 if options["restart"] else self.read_checkpoint(checkpoint, source)
+        if done:
+            self.stdout.write(f"Resuming after {done} records ({checkpoint}).")
+
+        User = get_user_model()
+        self.authors = {}
+        self.fallback_author = None
+        if options["author"]:
+            self.fallback_author = (
+                User.objects.filter(username=options["author"])
+                .values_list("pk", flat=True)
+                .first()
+            )
+            if self.fallback_author is None:
+                raise CommandError(f"No user named {options['author']!r}.")
+        self.categories = {}
+        self.bad_categories = {}
+        for pk, name, slug in Category.objects.values_list("pk", "name", "slug"):
+            self.categories[name] = self.categories[slug] = pk
+        self.default_category = options["category"]
+        self.skipped = Counter()
+        self.touched_categories = False
+
+        started = time.monotonic()
+        imported = 0
+        batch = []
+        for position, record in self.records(source, skip=done):
+            batch.append(record)
+            if len(batch) >= options["batch_size"]:
+                imported += self.import_batch(batch)
+                done = position
+                self.write_checkpoint(checkpoint, source, done)
+                batch = []
+                if options["verbosity"] > 1:
+                    self.stdout.write(f"  {done} records read, {imported} imported")
+        if batch:
+            imported += self.import_batch(batch)
+        checkpoint.unlink(missing_ok=True)
+
+        if imported or self.touched_categories:
+            for scope in caching.PAGE_SCOPES:
+                caching.bump(scope)
+        elapsed = time.monotonic() - started
+        rate = f" ({imported / elapsed:.0f}/s)" if imported and elapsed else ""
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {imported} posts in {elapsed:.1f}s{rate}; "
+                f"skipped {sum(self.skipped.values())}."
+            )
+        )
+        for reason, n in self.skipped.most_common():
+            self.stdout.write(f"  {n} {reason}")
+
+    # Reading
+
+    def records(self, source, skip=0):
+        """``(position, record)`` pairs, ``position`` counting from 1.
+
+        The first ``skip`` records are passed over without being parsed.
+        """
+        if source.is_dir():
+            paths = sorted(source.rglob("*.md"))
+            for position, path in enumerate(paths[skip:], start=skip + 1):
+                try:
+                    text = path.read_text(encoding="utf-8")
+                except UnicodeDecodeError:
+                    yield position, {"_error": "not UTF-8", "_where": str(path)}
+                    continue
+                meta, body = parse_markdown(text)
+                yield position, {**meta, "content": body, "_where": str(path)}
+            return
+
+        opener = gzip.open if source.suffix == ".gz" else open
+        # Read as bytes and decode line by line, so one badly encoded line
+        # is skipped instead of ending the import.
+        with opener(source, "rb") as fh:
+            position = 0
+            for number, line in enumerate(fh, start=1):
+                if not line.strip():
+                    continue
+                position += 1
+                if position <= skip:
+                    continue
+                where = f"{source}:{number}"
+                try:
+                    record = json.loads(line.decode("utf-8"))
+                except UnicodeDecodeError:
+                    record = {"_error": "not UTF-8"}
+                except ValueError:
+                    record = {"_error": "invalid JSON"}
+                if not isinstance(record, dict):
+                    record = {"_error": "not a JSON object"}
+                yield position, {**record, "_where": where}
+
+    def read_checkpoint(self, checkpoint, source):
+        try:
+            state = json.loads(checkpoint.read_text())
+        except FileNotFoundError:
+            return 0
+        except ValueError:
+            raise CommandError(f"{checkpoint} is corrupt; use --restart.")
+        if state.get("source") != str(source.resolve()) or state.get(
+            "database"
+        ) != str(connection.settings_dict["NAME"]):
+            raise CommandError(
+                f"{checkpoint} is for importing {state.get('source')} into "
+                f"{state.get('database')}; use --restart or --checkpoint."
+            )
+        return state["done"]
+
+    def write_checkpoint(self, checkpoint, source, done):
+        # Written after each batch commits. A crash in between re-reads one
+        # batch; its published posts and posts with a slug are found again
+        # and skipped, drafts without a slug would be imported twice.
+        partial = checkpoint.with_name(checkpoint.name + ".tmp")
+        state = {
+            "source": str(source.resolve()),
+            "database": str(connection.settings_dict["NAME"]),
+            "done": done,
+        }
+        partial.write_text(json.dumps(state))
+        partial.replace(checkpoint)
+
+    # Writing
+
+    def skip(self, record, reason):
+        if sum(self.skipped.values()) < SHOW_SKIPPED:
+            self.stderr.write(f"Skipped {record['_where']}: {reason}")
+        self.skipped[reason] += 1
+
+    def import_batch(self, records):
+        now = timezone.now()
+        self.resolve_authors(records)
+        posts = []
+        seen_titles = set()
+        seen_slugs = set()
+        for record in records:
+            post = self.build(record, now)
+            if post is None:
+                continue
+            published = post.status == Post.Status.PUBLISHED
+            # Published titles and slugs are unique.
+            if published and post.title in seen_titles:
+                self.skip(record, "duplicate published title")
+                continue
+            if post.slug and post.slug in seen_slugs:
+                self.skip(record, "duplicate slug")
+                continue
+            if published:
+                seen_titles.add(post.title)
+            if post.slug:
+                seen_slugs.add(post.slug)
+            posts.append(post)
+
+        existing = set(
+            Post.objects.filter(
+                status=Post.Status.PUBLISHED, title__in=seen_titles
+            ).values_list("title", flat=True)
+        )
+        taken = set(
+            Post.objects.filter(slug__in=seen_slugs).values_list("slug", flat=True)
+        )
+        fresh = []
+        for post in posts:
+            if post.status == Post.Status.PUBLISHED and post.title in existing:
+                self.skipped["already imported (published title exists)"] += 1
+            elif post.slug and post.slug in taken:
+                self.skipped["already imported (slug exists)"] += 1
+            else:
+                fresh.append(post)
+        if not fresh:
+            return 0
+
+        with transaction.atomic():
+            # Posts that bring their slug (kept so old URLs still work) go
+            # first, so the slugs allocated for the rest avoid them too.
+            Post.objects.bulk_create([p for p in fresh if p.slug])
+            unslugged = [p for p in fresh if not p.slug]
+            slugs = self.allocate_slugs([p.title for p in unslugged])
+            for post, slug in zip(unslugged, slugs):
+                post.slug = slug
+            Post.objects.bulk_create(unslugged)
+            search.index_posts((p.pk, p.title, p.content) for p in fresh)
+            # bulk_create skips the signals that keep the counters.
+            counters.posts_created(fresh)
+        return len(fresh)
+
+    def build(self, record, now):
+        """An unsaved ``Post`` for ``record``, or ``None`` if it is skipped."""
+        if "_error" in record:
+            self.skip(record, record["_error"])
+            return None
+        title = str(record.get("title") or "").strip()
+        if not title:
+            self.skip(record, "no title")
+            return None
+        if len(title) > TITLE_LENGTH:
+            self.skip(record, f"title longer than {TITLE_LENGTH} characters")
+            return None
+        author = record.get("author")
+        author_id = self.authors.get(str(author)) if author else None
+        author_id = author_id or self.fallback_author
+        if author_id is None:
+            self.skip(record, "unknown author")
+            return None
+        try:
+            category_id = self.category_id(
+                record.get("category") or self.default_category
+            )
+        except ValueError as exc:
+            self.skip(record, str(exc))
+            return None
+        if category_id is None:
+            self.skip(record, "no category")
+            return None
+        try:
+            published_at = parse_moment(
+                record.get("published_at") or record.get("date")
+            )
+        except ValueError as exc:
+            self.skip(record, str(exc))
+            return None
+
+        status = str(record.get("status") or "").lower()
+        if status not in Post.Status.values:
+            draft = is_true(record.get("draft", False))
+            status = Post.Status.DRAFT if draft else Post.Status.PUBLISHED
+        if status == Post.Status.PUBLISHED and published_at is None:
+            published_at = now
+        content = str(record.get("content") or record.get("body") or "")
+        return Post(
+            title=title,
+            slug=slugify(record.get("slug") or "")[:170],
+            content=content,
+            author_id=author_id,
+            category_id=category_id,
+            status=status,
+            published_at=published_at,
+            **post_summary_fields(content),
+        )
+
+    def allocate_slugs(self, titles):
+        """``Post.objects.allocate_slugs``, run only for titles that need it.
+
+        Most imported titles are distinct, and a slug that no post has and
+        only one title in the batch maps to is free as it is: one indexed
+        ``slug IN`` lookup finds those. The rest pay for the suffix scan,
+        which SQLite can't serve from the index.
+        """
+        bases = [slug_base(title) for title in titles]
+        counts = Counter(bases)
+        taken = set(
+            Post.objects.filter(slug__in=counts).values_list("slug", flat=True)
+        )
+        slow = [i for i, base in enumerate(bases) if base in taken or counts[base] > 1]
+        slugs = Post.objects.allocate_slugs([titles[i] for i in slow]) if slow else []
+        for i, slug in zip(slow, slugs):
+            bases[i] = slug
+        return bases
+
+    def resolve_authors(self, records):
+        """Look up the batch's new usernames in one query."""
+        names = {str(r["author"]) for r in records if r.get("author")}
+        names -= self.authors.keys()
+        if not names:
+            return
+        User = get_user_model()
+        found = dict(
+            User.objects.filter(username__in=names).values_list("username", "pk")
+        )
+        for name in names:
+            self.authors[name] = found.get(name)
+
+    def category_id(self, value):
+        """The category named (or slugged) ``value``, created if missing.
+
+        Raises ``ValueError`` if it can't be created because its (truncated)
+        name belongs to a category with another slug.
+        """
+        if not value:
+            return None
+        value = str(value).strip()
+        if value in self.bad_categories:
+            raise ValueError(self.bad_categories[value])
+        if value not in self.categories:
+            slug = slugify(value)[:80]
+            if not slug:
+                return None
+            if slug not in self.categories:
+                name = value[:CATEGORY_NAME_LENGTH]
+                try:
+                    category, _ = Category.objects.get_or_create(
+                        slug=slug, defaults={"name": name}
+                    )
+                except IntegrityError:
+                    self.bad_categories[value] = (
+                        f"category name {name!r} is taken by another category"
+                    )
+                    raise ValueError(self.bad_categories[value])
+                self.categories[slug] = category.pk
+                self.touched_categories = True
+            self.categories[value] = self.categories[slug]
+        return self.categories[value]
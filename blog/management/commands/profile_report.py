@@ -0,0 +1,101 @@
+import io
+import pstats
+import re
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.profiling import path_slug
+
+KINDS = ("cprofile", "sampled")
+# See blog.profiling.profile_name.
+NAME = re.compile(
+    r"^\d+T\d+-(?P<method>[A-Z]+)-(?P<path>.*)-(?P<ms>\d+)ms-(?P<kind>\w+)$"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Aggregate the request profiles written by ProfilingMiddleware and "
+        "print the hottest functions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dir", help="Profile directory (default: BLOG_PROFILE_DIR)."
+        )
+        parser.add_argument(
+            "--sort",
+            choices=["tottime", "cumulative", "calls"],
+            default="tottime",
+            help="tottime: time in the function itself; cumulative: "
+            "including what it calls.",
+        )
+        parser.add_argument("--limit", type=int, default=25)
+        parser.add_argument(
+            "--kind",
+            choices=KINDS,
+            help="Only cProfile'd (sampled fraction) or stack-sampled (slow) "
+            "requests. Mixing them adds exact and estimated times.",
+        )
+        parser.add_argument(
+            "--path", help="Only requests whose path contains this text."
+        )
+        parser.add_argument(
+            "--full-paths",
+            action="store_true",
+            help="Keep directories in file names.",
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete the profiles that were reported.",
+        )
+
+    def handle(self, *args, **options):
+        directory = Path(options["dir"] or settings.BLOG_PROFILE_DIR)
+        if not directory.is_dir():
+            raise CommandError(f"No profiles in {directory}.")
+
+        wanted = path_slug(options["path"]) if options["path"] else None
+        files = []
+        for path in sorted(directory.glob("*.prof")):
+            match = NAME.match(path.stem)
+            if not match:
+                continue
+            if options["kind"] and match["kind"] != options["kind"]:
+                continue
+            if wanted and wanted not in match["path"]:
+                continue
+            files.append((path, match))
+        if not files:
+            raise CommandError("No matching profiles.")
+
+        kinds = Counter(m["kind"] for _, m in files)
+        self.stdout.write(
+            f"{len(files)} profiles ("
+            + ", ".join(f"{n} {kind}" for kind, n in sorted(kinds.items()))
+            + ")"
+        )
+        self.stdout.write("Slowest requests (path as in the file name):")
+        for path, match in sorted(files, key=lambda f: -int(f[1]["ms"]))[:5]:
+            self.stdout.write(
+                f"  {int(match['ms']):>6} ms  {match['method']} "
+                f"{match['path']}  ({match['kind']})"
+            )
+
+        buffer = io.StringIO()
+        stats = pstats.Stats(*(str(p) for p, _ in files), stream=buffer)
+        # pstats would otherwise open with a line per profile file.
+        stats.files = []
+        if not options["full_paths"]:
+            stats.strip_dirs()
+        stats.sort_stats(options["sort"]).print_stats(options["limit"])
+        self.stdout.write(buffer.getvalue().strip("\n"))
+
+        if options["clear"]:
+            for path, _ in files:
+                path.unlink()
+            self.stdout.write(f"Deleted {len(files)} profiles.")
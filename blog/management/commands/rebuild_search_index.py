@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the post full-text search index from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write("Search index is not supported on this database.")
+            return
+        with transaction.atomic():
+            total = search.rebuild_index(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} posts."))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from blog import caching, counters
+
+# Scopes whose cached pages and cards show each counter.
+SCOPES = {"comments": ["posts", "comments"], "posts": ["categories", "posts"]}
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute Post.comment_count and Category.published_post_count "
+        "and fix any drift, in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=counters.RECONCILE_BATCH_SIZE
+        )
+        parser.add_argument(
+            "--only",
+            choices=counters.COUNTERS,
+            help="Reconcile just this counter.",
+        )
+
+    def handle(self, *args, **options):
+        names = [options["only"]] if options["only"] else counters.COUNTERS
+        for name in names:
+            fixed = sum(counters.reconcile(name, options["batch_size"]))
+            if fixed:
+                for scope in SCOPES[name]:
+                    caching.bump(scope)
+            self.stdout.write(f"{name}: fixed {fixed} rows")
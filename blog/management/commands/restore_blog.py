@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import backup
+
+
+class Command(BaseCommand):
+    help = (
+        "Load an export_blog file (full or incremental), inserting new rows "
+        "and updating existing ones by primary key."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths",
+            nargs="+",
+            help="Export files, oldest first: a full export, then the "
+            "incremental ones taken after it.",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=backup.RESTORE_BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        for path in options["paths"]:
+            began = time.monotonic()
+            try:
+                restored, fixed = backup.restore(
+                    path, batch_size=options["batch_size"]
+                )
+            except (OSError, ValueError, LookupError) as exc:
+                raise CommandError(f"{path}: {exc}")
+            for label, n in restored.items():
+                self.stdout.write(f"{label}: {n}")
+            for name, n in fixed.items():
+                self.stdout.write(f"{name} counters fixed: {n}")
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Restored {path} in {time.monotonic() - began:.1f}s."
+                )
+            )
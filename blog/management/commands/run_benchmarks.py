@@ -0,0 +1,345 @@
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from collections import Counter
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from blog import urls as blog_urls
+from blog.models import Category, Comment, Post
+
+DEFAULT_REQUESTS = 30
+MODES = ("cold", "warm")
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Sampler:
+    """Picks the objects each scenario requests, reproducibly."""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        published = Post.objects.published().order_by("pk")
+        self.slugs = list(published.values_list("slug", flat=True))
+        if not self.slugs:
+            raise CommandError("No published posts; run seed_benchmark_data.")
+        self.popular = published.order_by("-comment_count", "pk").first()
+        self.categories = list(
+            Category.objects.order_by("pk").values_list("slug", flat=True)
+        )
+        self.authors = list(
+            published.order_by("author_id")
+            .values_list("author__username", flat=True)
+            .distinct()[:1000]
+        )
+        self.words = [w for w in self.popular.title.split() if len(w) > 3] or ["post"]
+        self.comment_pk = (
+            Comment.objects.order_by("pk").values_list("pk", flat=True).first()
+        )
+
+    def post(self):
+        return self.rng.choice(self.slugs)
+
+    def category(self):
+        return self.rng.choice(self.categories)
+
+    def author(self):
+        return self.rng.choice(self.authors)
+
+    def word(self):
+        return self.rng.choice(self.words)
+
+
+def scenarios(sampler):
+    """``{name: (url_name or None, login, method, make_url)}``."""
+    user = sampler.popular.author
+    reset = (
+        urlsafe_base64_encode(force_bytes(user.pk)),
+        default_token_generator.make_token(user),
+    )
+
+    def url(name, *args):
+        return lambda: reverse(name, args=[a() if callable(a) else a for a in args])
+
+    return {
+        "home": ("blog:home", False, "get", url("blog:home")),
+        "home_legacy_page_5": (
+            "blog:home",
+            False,
+            "get",
+            lambda: reverse("blog:home") + "?page=5",
+        ),
+        "home_search": (
+            "blog:home",
+            False,
+            "get",
+            lambda: reverse("blog:home") + f"?q={sampler.word()}",
+        ),
+        "category_list": (
+            "blog:category_list",
+            False,
+            "get",
+            url("blog:category_list"),
+        ),
+        "category_detail": (
+            "blog:category_detail",
+            False,
+            "get",
+            url("blog:category_detail", sampler.category),
+        ),
+        "post_detail": (
+            "blog:post_detail",
+            False,
+            "get",
+            url("blog:post_detail", sampler.post),
+        ),
+        "post_detail_popular": (
+            "blog:post_detail",
+            False,
+            "get",
+            url("blog:post_detail", sampler.popular.slug),
+        ),
+        "post_comments_json": (
+            "blog:post_comments",
+            False,
+            "get",
+            lambda: reverse("blog:post_comments", args=[sampler.popular.slug])
+            + "?format=json",
+        ),
+        "profile_detail": (
+            "blog:profile_detail",
+            False,
+            "get",
+            url("blog:profile_detail", sampler.author),
+        ),
+        "feed_rss": ("blog:feed_rss", False, "get", url("blog:feed_rss")),
+        "feed_atom": ("blog:feed_atom", False, "get", url("blog:feed_atom")),
+        "post_create": ("blog:post_create", True, "get", url("blog:post_create")),
+        "post_edit": (
+            "blog:post_edit",
+            True,
+            "get",
+            url("blog:post_edit", sampler.popular.slug),
+        ),
+        "post_delete": (
+            "blog:post_delete",
+            True,
+            "get",
+            url("blog:post_delete", sampler.popular.slug),
+        ),
+        "profile_edit": ("blog:profile_edit", True, "get", url("blog:profile_edit")),
+        # A GET only answers "not allowed" and redirects; nothing is deleted.
+        "comment_delete": (
+            "blog:comment_delete",
+            True,
+            "get",
+            url("blog:comment_delete", sampler.comment_pk or 0),
+        ),
+        "login": ("blog:login", False, "get", url("blog:login")),
+        "logout": ("blog:logout", True, "post", url("blog:logout")),
+        "register": ("blog:register", False, "get", url("blog:register")),
+        "password_reset": (
+            "blog:password_reset",
+            False,
+            "get",
+            url("blog:password_reset"),
+        ),
+        "password_reset_done": (
+            "blog:password_reset_done",
+            False,
+            "get",
+            url("blog:password_reset_done"),
+        ),
+        "password_reset_confirm": (
+            "blog:password_reset_confirm",
+            False,
+            "get",
+            url("blog:password_reset_confirm", *reset),
+        ),
+        "password_reset_complete": (
+            "blog:password_reset_complete",
+            False,
+            "get",
+            url("blog:password_reset_complete"),
+        ),
+        "sitemap_index": (None, False, "get", url("sitemap")),
+        "sitemap_posts": (
+            None,
+            False,
+            "get",
+            url("django.contrib.sitemaps.views.sitemap", "posts"),
+        ),
+        "sitemap_categories": (
+            None,
+            False,
+            "get",
+            url("django.contrib.sitemaps.views.sitemap", "categories"),
+        ),
+        "robots_txt": (None, False, "get", url("robots_txt")),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every blog route (plus sitemaps and feeds) against the "
+        "current database and write latency percentiles, queries per request "
+        "and response sizes to a JSON report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=DEFAULT_REQUESTS,
+            help="Samples per scenario and cache mode.",
+        )
+        parser.add_argument(
+            "--mode",
+            choices=MODES,
+            nargs="+",
+            default=list(MODES),
+            help="cold clears the cache before every request; warm primes it.",
+        )
+        parser.add_argument("--only", nargs="+", help="Run just these scenarios.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument(
+            "--output", default="benchmark-report.json", help="Report path."
+        )
+        parser.add_argument(
+            "--compare", help="Print the change against an earlier report."
+        )
+
+    def handle(self, *args, **options):
+        sampler = Sampler(options["seed"])
+        all_scenarios = scenarios(sampler)
+        covered = {s[0].split(":", 1)[1] for s in all_scenarios.values() if s[0]}
+        missing = sorted(p.name for p in blog_urls.urlpatterns if p.name not in covered)
+        if missing:
+            raise CommandError(f"No benchmark scenario for: {', '.join(missing)}")
+
+        selected = options["only"] or list(all_scenarios)
+        unknown = set(selected) - set(all_scenarios)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        results = {}
+        hosts = [*settings.ALLOWED_HOSTS, "testserver"]
+        with override_settings(ALLOWED_HOSTS=hosts):
+            for name in selected:
+                results[name] = {
+                    mode: self.measure(
+                        all_scenarios[name], sampler, mode, options["requests"]
+                    )
+                    for mode in options["mode"]
+                }
+                self.stdout.write(self.summary(name, results[name]))
+
+        report = {"meta": self.meta(options), "scenarios": results}
+        Path(options["output"]).write_text(
+            json.dumps(report, indent=2, sort_keys=True) + "\n"
+        )
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        if options["compare"]:
+            self.compare(json.loads(Path(options["compare"]).read_text()), report)
+
+    def measure(self, scenario, sampler, mode, requests):
+        _, login, method, make_url = scenario
+        client = Client()
+        user = sampler.popular.author
+        latencies, queries, sizes, statuses = [], [], [], Counter()
+        for _ in range(requests):
+            url = make_url()
+            if mode == "cold":
+                cache.clear()
+            elif login:
+                client.force_login(user)
+                getattr(client, method)(url)
+            else:
+                getattr(client, method)(url)
+            if login:
+                client.force_login(user)
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = getattr(client, method)(url)
+                content = b"".join(response) if response.streaming else response.content
+                latencies.append((time.perf_counter() - start) * 1000)
+            queries.append(len(ctx.captured_queries))
+            sizes.append(len(content))
+            statuses[str(response.status_code)] += 1
+        return {
+            "requests": requests,
+            "status": dict(statuses),
+            "p50_ms": round(_percentile(latencies, 0.50), 2),
+            "p95_ms": round(_percentile(latencies, 0.95), 2),
+            "p99_ms": round(_percentile(latencies, 0.99), 2),
+            "mean_ms": round(statistics.fmean(latencies), 2),
+            "queries_mean": round(statistics.fmean(queries), 2),
+            "queries_max": max(queries),
+            "bytes_mean": round(statistics.fmean(sizes)),
+        }
+
+    def summary(self, name, modes):
+        parts = [
+            f"{mode} p50 {r['p50_ms']:.1f} p99 {r['p99_ms']:.1f} ms, "
+            f"{r['queries_mean']:.1f} q, {r['bytes_mean']} B"
+            for mode, r in modes.items()
+        ]
+        return f"{name:<26} " + " | ".join(parts)
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=settings.BASE_DIR,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            "commit": commit,
+            "database": connection.vendor,
+            "cache": settings.CACHES["default"]["BACKEND"],
+            "django": django.get_version(),
+            "python": platform.python_version(),
+            "requests": options["requests"],
+            "seed": options["seed"],
+            "dataset": {
+                "posts": Post.objects.count(),
+                "comments": Comment.objects.count(),
+                "categories": Category.objects.count(),
+            },
+        }
+
+    def compare(self, before, after):
+        self.stdout.write(f"Change since {before['meta'].get('commit') or 'baseline'}:")
+        for name, modes in after["scenarios"].items():
+            for mode, now in modes.items():
+                then = before["scenarios"].get(name, {}).get(mode)
+                if not then:
+                    continue
+                self.stdout.write(
+                    f"{name:<26} {mode:<4} "
+                    f"p95 {then['p95_ms']:.1f} -> {now['p95_ms']:.1f} ms, "
+                    f"queries {then['queries_mean']:.1f} -> "
+                    f"{now['queries_mean']:.1f}, "
+                    f"bytes {then['bytes_mean']} -> {now['bytes_mean']}"
+                )
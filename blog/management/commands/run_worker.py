@@ -0,0 +1,69 @@
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from blog import tasks
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (media uploads, cleanups, ...)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=getattr(settings, "BLOG_TASK_WORKERS", 2),
+            help="Number of jobs run in parallel (threads).",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Seconds to sleep when the queue is empty.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain the queue and exit instead of polling forever.",
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(sig, lambda *_: self.stopping.set())
+
+        concurrency = max(1, options["concurrency"])
+        name = tasks.worker_name()
+        if concurrency == 1:
+            total = self.loop(name, options)
+        else:
+            with ThreadPoolExecutor(concurrency, "blog-worker") as pool:
+                futures = [
+                    pool.submit(self.loop, f"{name}:{i}", options)
+                    for i in range(concurrency)
+                ]
+                total = sum(f.result() for f in futures)
+        self.stdout.write(self.style.SUCCESS(f"Ran {total} jobs."))
+
+    def loop(self, worker, options):
+        total = 0
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                job = tasks.claim(worker)
+                if job is None:
+                    if options["once"]:
+                        break
+                    self.stopping.wait(options["poll_interval"])
+                    continue
+                tasks.run_job(job)
+                total += 1
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connections.close_all()
+        return total
@@ -0,0 +1,233 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from blog import caching, counters, search
+from blog.models import Category, Comment, Post, Profile, post_summary_fields
+
+PREFIX = "bench"
+PASSWORD = "bench-pass"
+# Words are drawn with a Zipf-like skew so text compresses and tokenizes
+# roughly like prose; lengths are log-normal around these medians.
+VOCABULARY_SIZE = 5000
+POST_WORDS = 700
+COMMENT_WORDS = 30
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "te", "vo", "zi", "pa", "do"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a synthetic corpus for benchmarks: users "
+        "(with profiles), categories, posts and comments. Rows are tagged "
+        f"with the {PREFIX!r} prefix and can be removed with --flush."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10_000)
+        parser.add_argument("--categories", type=int, default=20)
+        parser.add_argument("--posts", type=int, default=100_000)
+        parser.add_argument("--comments", type=int, default=1_000_000)
+        parser.add_argument(
+            "--draft-ratio",
+            type=float,
+            default=0.05,
+            help="Share of posts left as drafts.",
+        )
+        parser.add_argument(
+            "--scheduled-ratio",
+            type=float,
+            default=0.01,
+            help="Share of published posts dated in the future.",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=1,
+            help="Random seed; the same seed gives the same corpus.",
+        )
+        parser.add_argument(
+            "--flush",
+            action="store_true",
+            help="Delete previously seeded rows first.",
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        if options["flush"]:
+            self.flush()
+        elif User.objects.filter(username__startswith=f"{PREFIX}-user-").exists():
+            raise CommandError("Benchmark data already exists; use --flush.")
+
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.vocabulary = self.make_vocabulary()
+        self.weights = [1 / (rank + 1) for rank in range(VOCABULARY_SIZE)]
+
+        started = time.monotonic()
+        user_ids = self.step("users", self.seed_users, options["users"])
+        category_ids = self.step(
+            "categories", self.seed_categories, options["categories"]
+        )
+        post_ids = self.step(
+            "posts",
+            self.seed_posts,
+            options["posts"],
+            user_ids,
+            category_ids,
+            options["draft_ratio"],
+            options["scheduled_ratio"],
+        )
+        self.step(
+            "comments", self.seed_comments, options["comments"], user_ids, post_ids
+        )
+
+        self.stdout.write("Reconciling counters...")
+        for name in counters.COUNTERS:
+            sum(counters.reconcile(name))
+        for scope in caching.PAGE_SCOPES:
+            caching.bump(scope)
+        self.stdout.write(
+            self.style.SUCCESS(f"Seeded in {time.monotonic() - started:.0f}s.")
+        )
+
+    def step(self, label, func, *args):
+        started = time.monotonic()
+        ids = func(*args)
+        self.stdout.write(
+            f"{label}: {len(ids)} rows in {time.monotonic() - started:.1f}s"
+        )
+        return ids
+
+    def flush(self):
+        User = get_user_model()
+        users = User.objects.filter(username__startswith=f"{PREFIX}-user-")
+        posts = Post.objects.filter(author__in=users)
+        with transaction.atomic():
+            # Plain DELETEs: going through the collector would fire signals
+            # (and cleanup jobs) for every one of a million rows.
+            search.remove_posts(posts.values_list("pk", flat=True))
+            Comment.objects.filter(post__in=posts)._raw_delete(Comment.objects.db)
+            Comment.objects.filter(author__in=users)._raw_delete(Comment.objects.db)
+            posts._raw_delete(Post.objects.db)
+            Profile.objects.filter(user__in=users)._raw_delete(Profile.objects.db)
+            Category.objects.filter(slug__startswith=f"{PREFIX}-").exclude(
+                posts__isnull=False
+            ).delete()
+            users.delete()
+        for name in counters.COUNTERS:
+            sum(counters.reconcile(name))
+
+    def make_vocabulary(self):
+        words = set()
+        while len(words) < VOCABULARY_SIZE:
+            length = self.rng.choice([1, 2, 2, 3, 3, 4])
+            words.add("".join(self.rng.choices(SYLLABLES, k=length)))
+        return sorted(words, key=len)
+
+    def words(self, median):
+        count = max(3, int(self.rng.lognormvariate(0, 0.6) * median))
+        return self.rng.choices(self.vocabulary, self.weights, k=count)
+
+    def paragraphs(self, median):
+        words = self.words(median)
+        chunks = [
+            " ".join(words[i: i + 80]).capitalize() + "."
+            for i in range(0, len(words), 80)
+        ]
+        return "\n\n".join(chunks)
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield range(start, min(total, start + self.batch_size))
+
+    def seed_users(self, total):
+        User = get_user_model()
+        password = make_password(PASSWORD)
+        ids = []
+        for batch in self.batches(total):
+            users = User.objects.bulk_create(
+                User(
+                    username=f"{PREFIX}-user-{i}",
+                    email=f"{PREFIX}-user-{i}@example.com",
+                    password=password,
+                )
+                for i in batch
+            )
+            # bulk_create skips the signal that creates profiles.
+            Profile.objects.bulk_create(
+                Profile(user=user, bio=" ".join(self.words(20))) for user in users
+            )
+            ids.extend(user.pk for user in users)
+        return ids
+
+    def seed_categories(self, total):
+        categories = Category.objects.bulk_create(
+            Category(
+                name=f"{PREFIX.title()} {i} {self.rng.choice(self.vocabulary)}",
+                slug=f"{PREFIX}-{i}",
+                description=" ".join(self.words(15)),
+            )
+            for i in range(total)
+        )
+        return [c.pk for c in categories]
+
+    def seed_posts(self, total, user_ids, category_ids, draft_ratio, scheduled_ratio):
+        now = timezone.now()
+        # A tenth of the users write; everyone comments.
+        authors = user_ids[: max(1, len(user_ids) // 10)]
+        ids = []
+        for batch in self.batches(total):
+            posts = []
+            for i in batch:
+                content = self.paragraphs(POST_WORDS)
+                title = " ".join(self.words(6)[:8]).capitalize()
+                status = Post.Status.PUBLISHED
+                published_at = now - timedelta(
+                    minutes=self.rng.randrange(5 * 365 * 24 * 60)
+                )
+                if self.rng.random() < draft_ratio:
+                    status, published_at = Post.Status.DRAFT, None
+                elif self.rng.random() < scheduled_ratio:
+                    published_at = now + timedelta(
+                        minutes=self.rng.randrange(1, 30 * 24 * 60)
+                    )
+                posts.append(
+                    Post(
+                        title=f"{title} {i}"[:150],
+                        slug=f"{PREFIX}-{i}",
+                        content=content,
+                        author_id=self.rng.choice(authors),
+                        category_id=self.rng.choice(category_ids),
+                        status=status,
+                        published_at=published_at,
+                        **post_summary_fields(content),
+                    )
+                )
+            with transaction.atomic():
+                Post.objects.bulk_create(posts)
+                search.index_posts((p.pk, p.title, p.content) for p in posts)
+            ids.extend(p.pk for p in posts)
+        return ids
+
+    def seed_comments(self, total, user_ids, post_ids):
+        if not post_ids:
+            return []
+        for batch in self.batches(total):
+            comments = [
+                Comment(
+                    # Skewed towards a few popular posts.
+                    post_id=post_ids[int(len(post_ids) * self.rng.random() ** 3)],
+                    author_id=self.rng.choice(user_ids),
+                    content=self.paragraphs(COMMENT_WORDS),
+                )
+                for _ in batch
+            ]
+            Comment.objects.bulk_create(comments)
+        return range(total)
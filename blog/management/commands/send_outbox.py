@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blog import mail
+from blog.models import OutboundEmail
+
+
+class Command(BaseCommand):
+    help = "Send queued outbound email in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=mail.BATCH_SIZE)
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Send what is due and exit instead of polling forever.",
+        )
+        parser.add_argument("--poll-interval", type=float, default=5.0)
+        parser.add_argument(
+            "--requeue-failed",
+            action="store_true",
+            help="Give dead-lettered messages a fresh set of attempts first.",
+        )
+
+    def handle(self, *args, **options):
+        if options["requeue_failed"]:
+            count = OutboundEmail.objects.filter(
+                status=OutboundEmail.Status.FAILED
+            ).update(
+                status=OutboundEmail.Status.PENDING,
+                attempts=0,
+                next_attempt_at=timezone.now(),
+            )
+            self.stdout.write(f"Requeued {count} failed messages.")
+
+        total = 0
+        try:
+            while True:
+                total += mail.deliver_outbox(options["batch_size"])
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Sent {total} messages."))
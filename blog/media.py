@@ -0,0 +1,242 @@
+"""Uploads that reach storage in the background.
+
+A new featured image or avatar is not sent to the media storage during
+the request. ``prepare`` (a ``pre_save`` hook) writes it to the
+``staging`` storage instead, keeps the field on its previous file and
+records the staged name in ``pending_media``. A background job then
+uploads it, builds its derivatives and swaps it in. Replaced and deleted
+files are removed by jobs too, so request latency never depends on the
+storage provider.
+
+Staging is ``DatabaseStagingStorage``: the worker is another process,
+often on another machine, and the database is what both can read.
+"""
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage, storages
+
+from . import caching, images, tasks
+
+STAGING = "staging"
+
+
+class DatabaseStagingStorage(Storage):
+    """Staged uploads as ``StagedUpload`` rows.
+
+    Saved in the same transaction as the post or profile that brings
+    them, so an upload whose save is rolled back leaves nothing behind.
+    Uploads are small (see ``blog.forms``), so each is one row.
+    """
+
+    def _open(self, name, mode="rb"):
+        from .models import StagedUpload
+
+        content = (
+            StagedUpload.objects.filter(name=name)
+            .values_list("content", flat=True)
+            .first()
+        )
+        if content is None:
+            raise FileNotFoundError(f"No staged upload named {name!r}.")
+        return ContentFile(bytes(content), name=name)
+
+    def _save(self, name, content):
+        from .models import StagedUpload
+
+        StagedUpload.objects.create(name=name, content=b"".join(content.chunks()))
+        return name
+
+    def delete(self, name):
+        from .models import StagedUpload
+
+        StagedUpload.objects.filter(name=name).delete()
+
+    def exists(self, name):
+        from .models import StagedUpload
+
+        return StagedUpload.objects.filter(name=name).exists()
+
+    def size(self, name):
+        with self.open(name) as fh:
+            return fh.size
+
+
+def staging_storage():
+    return storages[STAGING]
+
+
+def media_storage():
+    return storages["default"]
+
+
+def _spec(instance):
+    """``(file field, manifest field, job)`` for a model with media."""
+    from .models import Post, Profile
+
+    if isinstance(instance, Post):
+        return "featured_image", "image_variants", store_post_image
+    if isinstance(instance, Profile):
+        return "avatar", "avatar_variants", store_avatar
+    raise TypeError(f"{type(instance).__name__} has no managed media")
+
+
+def delete_later(names, staged=False):
+    names = sorted(n for n in names if n)
+    if names:
+        tasks.enqueue(delete_media, names=names, staged=staged)
+
+
+def prepare(instance, update_fields=None):
+    """Stage a fresh upload on ``instance`` and note files to discard."""
+    field_name, manifest_field, _ = _spec(instance)
+    if update_fields is not None and field_name not in update_fields:
+        return
+
+    model = type(instance)
+    previous = {}
+    if instance.pk:
+        previous = (
+            model._base_manager.filter(pk=instance.pk)
+            .values(field_name, manifest_field)
+            .first()
+        ) or {}
+    old_name = previous.get(field_name) or ""
+    old_manifest = previous.get(manifest_field) or {}
+
+    field_file = getattr(instance, field_name)
+    staging_allowed = update_fields is None or "pending_media" in update_fields
+    if field_file and not field_file._committed and staging_allowed:
+        upload_name = field_file.field.generate_filename(instance, field_file.name)
+        staged = staging_storage().save(upload_name, field_file.file)
+        if instance.pending_media:
+            instance._media_discard_staged = [instance.pending_media]
+        setattr(instance, field_name, old_name or None)
+        instance.pending_media = staged
+        instance._media_staged = staged
+    elif old_name and field_file.name != old_name:
+        # Cleared, or replaced inline (e.g. ``update_fields`` without
+        # ``pending_media``): the old file and its derivatives go.
+        instance._media_discard = [old_name, *images.manifest_names(old_manifest)]
+        if not field_file:
+            setattr(instance, manifest_field, {})
+
+
+def finish(instance):
+    """Queue the jobs ``prepare`` decided on (``post_save`` hook)."""
+    _, _, job = _spec(instance)
+    staged = instance.__dict__.pop("_media_staged", None)
+    if staged:
+        tasks.enqueue(job, pk=instance.pk, staged_name=staged)
+    delete_later(instance.__dict__.pop("_media_discard", []))
+    delete_later(instance.__dict__.pop("_media_discard_staged", []), staged=True)
+
+
+def discard(instance):
+    """Remove every file of a deleted ``instance`` (``post_delete`` hook)."""
+    field_name, manifest_field, _ = _spec(instance)
+    delete_later(
+        [
+            getattr(instance, field_name).name,
+            *images.manifest_names(getattr(instance, manifest_field)),
+        ]
+    )
+    delete_later([instance.pending_media], staged=True)
+
+
+def _store_staged(model, pk, staged_name, build):
+    """Move a staged upload into place; returns the updated instance or None.
+
+    ``build(fh, storage)`` stores what it needs and returns the new
+    ``(name, manifest)``. If the instance was deleted or has a newer
+    upload pending by now, the work is thrown away.
+    """
+    instance = model._base_manager.filter(pk=pk).first()
+    staging = staging_storage()
+    if instance is None or instance.pending_media != staged_name:
+        staging.delete(staged_name)
+        return None
+
+    field_name, manifest_field, _ = _spec(instance)
+    old_file = getattr(instance, field_name)
+    old = {old_file.name, *images.manifest_names(getattr(instance, manifest_field))}
+    with staging.open(staged_name) as fh:
+        name, manifest = build(fh, media_storage())
+    new = {name, *images.manifest_names(manifest)}
+
+    updated = model._base_manager.filter(
+        pk=pk, pending_media=staged_name
+    ).update(**{field_name: name, manifest_field: manifest, "pending_media": ""})
+    staging.delete(staged_name)
+    if not updated:
+        delete_later(new - old)
+        return None
+    delete_later(old - new)
+    return instance
+
+
+@tasks.register
+def store_post_image(pk, staged_name):
+    from .models import Post
+
+    def build(fh, storage):
+        name = storage.save(staged_name, fh)
+        fh.seek(0)
+        return name, images.generate_variants(fh, name, storage)
+
+    if _store_staged(Post, pk, staged_name, build):
+        caching.bump("post", pk)
+        caching.bump("posts")
+
+
+@tasks.register
+def store_avatar(pk, staged_name):
+    from .models import Profile
+
+    def build(fh, storage):
+        manifest = images.generate_avatar_variants(fh, staged_name, storage)
+        return manifest["source"], manifest
+
+    profile = _store_staged(Profile, pk, staged_name, build)
+    if profile:
+        caching.bump("author", profile.user_id)
+        caching.bump("authors")
+
+
+def _abandon_staged(model, pk, staged_name):
+    """Drop a staged upload whose job gave up; the field keeps its old file."""
+    model._base_manager.filter(pk=pk, pending_media=staged_name).update(
+        pending_media=""
+    )
+    staging_storage().delete(staged_name)
+
+
+@tasks.on_give_up(store_post_image)
+def abandon_post_image(pk, staged_name):
+    from .models import Post
+
+    _abandon_staged(Post, pk, staged_name)
+
+
+@tasks.on_give_up(store_avatar)
+def abandon_avatar(pk, staged_name):
+    from .models import Profile
+
+    _abandon_staged(Profile, pk, staged_name)
+
+
+@tasks.register
+def build_post_image_variants(pk):
+    """Derivatives for an image that was stored without them."""
+    from .models import Post
+
+    post = Post.objects.filter(pk=pk).first()
+    if post and not post.pending_media and post.update_image_variants():
+        caching.bump("post", pk)
+        caching.bump("posts")
+
+
+@tasks.register
+def delete_media(names, staged=False):
+    storage = staging_storage() if staged else media_storage()
+    for name in names:
+        storage.delete(name)
@@ -0,0 +1,400 @@
+import cProfile
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import (
+    iscoroutinefunction,
+    markcoroutinefunction,
+    sync_to_async,
+)
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import assets, profiling, replicas
+
+query_logger = logging.getLogger("blog.queries")
+
+QUERY_BUDGET = 25
+QUERY_TIME_BUDGET_MS = 250
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise that stays on the event loop under ASGI.
+
+    The stock middleware is sync-only, so Django would run it, and every
+    request behind it, through the single shared sync thread. Static
+    lookups are a dict access; only serving a matched file (which opens
+    it) leaves the loop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(
+                static_file, request
+            )
+        return await self.get_response(request)
+
+
+class QueryStats:
+    """Queries run on behalf of one request, across threads and databases."""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.statements = Counter()
+
+    def add(self, sql, seconds):
+        self.count += 1
+        self.time += seconds
+        self.statements[sql] += 1
+
+    @property
+    def time_ms(self):
+        return self.time * 1000
+
+    def repeated(self):
+        """The most repeated statement and its count (an N+1 suspect)."""
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+
+# A context variable rather than a thread-local: it follows the request
+# into the threads ``sync_to_async`` runs database calls in.
+_current_stats = ContextVar("blog_query_stats", default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add(sql, time.perf_counter() - start)
+
+
+def _install(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def install_query_counter():
+    """Hook ``_count_query`` into every connection, now and future ones."""
+    connection_created.connect(_install, dispatch_uid="blog.query_counter")
+    for connection in connections.all(initialized_only=True):
+        _install(connection)
+
+
+class QueryBudgetMiddleware:
+    """Count each request's queries and database time; log the heavy ones.
+
+    Requests over ``BLOG_QUERY_BUDGET`` queries or
+    ``BLOG_QUERY_TIME_BUDGET_MS`` of database time are logged to
+    ``blog.queries`` with their most repeated statement, which is usually
+    the N+1. The numbers are also left on ``request.query_stats``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_query_counter()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = request.query_stats = QueryStats()
+        token = _current_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        self.check(request, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = request.query_stats = QueryStats()
+        token = _current_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        self.check(request, stats)
+        return response
+
+    def check(self, request, stats):
+        max_queries = getattr(settings, "BLOG_QUERY_BUDGET", QUERY_BUDGET)
+        max_time_ms = getattr(
+            settings, "BLOG_QUERY_TIME_BUDGET_MS", QUERY_TIME_BUDGET_MS
+        )
+        if stats.count <= max_queries and stats.time_ms <= max_time_ms:
+            return
+        sql, repeats = stats.repeated()
+        query_logger.warning(
+            "%s %s ran %d queries in %.1f ms; most repeated (%dx): %s",
+            request.method,
+            request.path,
+            stats.count,
+            stats.time_ms,
+            repeats,
+            sql[:300],
+            extra={
+                "path": request.path,
+                "queries": stats.count,
+                "db_time_ms": round(stats.time_ms, 1),
+            },
+        )
+
+
+class ServerTimingMiddleware:
+    """Break each response's time down in a ``Server-Timing`` header.
+
+    ``db`` comes from ``QueryBudgetMiddleware`` (which must run inside this
+    one), ``connect`` (pool checkout), ``template`` and ``storage`` from
+    ``blog.profiling``. Only loaded with ``BLOG_SERVER_TIMING = True`` (the
+    default under ``DEBUG``): the numbers say a lot about the backend.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "BLOG_SERVER_TIMING", settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        profiling.instrument()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        began = time.perf_counter()
+        timings, token = profiling.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiling.stop(token)
+        return self.annotate(request, response, timings, began)
+
+    async def __acall__(self, request):
+        began = time.perf_counter()
+        timings, token = profiling.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiling.stop(token)
+        return self.annotate(request, response, timings, began)
+
+    def annotate(self, request, response, timings, began):
+        response["Server-Timing"] = timings.header(
+            time.perf_counter() - began, getattr(request, "query_stats", None)
+        )
+        return response
+
+
+class ProfilingMiddleware:
+    """Keep ``pstats`` profiles of sampled and of slow requests.
+
+    ``BLOG_PROFILE_SAMPLE_RATE`` of requests run under ``cProfile``. With
+    ``BLOG_PROFILE_SLOW_MS`` set, every other request is watched by the
+    (much cheaper) ``profiling.StackSampler`` and its profile kept if the
+    request took longer. Profiles go to ``BLOG_PROFILE_DIR``; read them with
+    ``manage.py profile_report``.
+
+    Sync-only on purpose: under ASGI Django then runs the rest of the
+    request in one thread, where both profilers can see the ORM and the
+    templates. That costs concurrency, so it is only loaded while one of
+    the two settings is on.
+    """
+
+    def __init__(self, get_response):
+        self.rate = getattr(settings, "BLOG_PROFILE_SAMPLE_RATE", 0)
+        self.slow_ms = getattr(settings, "BLOG_PROFILE_SLOW_MS", 0)
+        if not (self.rate or self.slow_ms):
+            raise MiddlewareNotUsed
+        self.directory = settings.BLOG_PROFILE_DIR
+        self.interval = (
+            getattr(
+                settings, "BLOG_PROFILE_INTERVAL_MS", profiling.SAMPLE_INTERVAL_MS
+            )
+            / 1000
+        )
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if self.rate and random.random() < self.rate:
+            kind, profiler = "cprofile", cProfile.Profile()
+            profiler.enable()
+        elif self.slow_ms:
+            kind = "sampled"
+            profiler = profiling.StackSampler(threading.get_ident(), self.interval)
+            profiler.start()
+        else:
+            return self.get_response(request)
+
+        began = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - began
+            if kind == "cprofile":
+                profiler.disable()
+            else:
+                profiler.stop()
+            if kind == "cprofile" or elapsed * 1000 >= self.slow_ms:
+                profiling.save(profiler, self.directory, request, elapsed, kind)
+
+
+class AssetPreloadMiddleware:
+    """Preload the assets every page needs with a ``Link`` header.
+
+    Only on HTML pages; a proxy or CDN that supports it (e.g. Cloudflare)
+    sends the same links ahead of the page as ``103 Early Hints``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.annotate(self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.annotate(await self.get_response(request))
+
+    def annotate(self, response):
+        if response.status_code == 200 and response.get(
+            "Content-Type", ""
+        ).startswith("text/html"):
+            links = assets.preload_links()
+            if links:
+                response["Link"] = links
+        return response
+
+
+class ReplicaMiddleware:
+    """Serve safe requests' content reads from a read replica.
+
+    A request that writes reads from the primary too, and pins the
+    browser to it for ``replicas.pin_seconds()`` with a cookie, so that it
+    reads its own writes on the page it is redirected to. Not used unless
+    ``BLOG_READ_REPLICAS`` names a database.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replicas.replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.use_replica(request):
+            return self.pin(request, self.get_response(request))
+        with replicas.replica_reads():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not self.use_replica(request):
+            return self.pin(request, await self.get_response(request))
+        with replicas.replica_reads():
+            return await self.get_response(request)
+
+    def use_replica(self, request):
+        return (
+            request.method in ("GET", "HEAD", "OPTIONS")
+            and replicas.PIN_COOKIE not in request.COOKIES
+        )
+
+    def pin(self, request, response):
+        if request.method not in ("GET", "HEAD", "OPTIONS"):
+            response.set_cookie(
+                replicas.PIN_COOKIE,
+                "1",
+                max_age=replicas.pin_seconds(),
+                secure=request.is_secure(),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+class SessionlessAnonymousMiddleware:
+    """Settle ``request.user`` as anonymous when there is no session cookie.
+
+    ``AuthenticationMiddleware``'s lazy user loads the session on first
+    use, and a loaded session makes ``SessionMiddleware`` add ``Vary:
+    Cookie``, splitting shared caches per cookie for readers who have no
+    session at all. Goes right after ``AuthenticationMiddleware``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.settle(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self.settle(request)
+        return await self.get_response(request)
+
+    def settle(self, request):
+        if settings.SESSION_COOKIE_NAME in request.COOKIES:
+            return
+        user = AnonymousUser()
+
+        async def auser():
+            return user
+
+        request.user = user
+        request.auser = auser
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:12
+
+from django.db import migrations
+
+# Frozen copy of the index schema at the time of this migration; later
+# changes to blog.search must not change what replaying it creates.
+SQLITE_TABLE = "blog_post_fts"
+POSTGRES_TABLE = "blog_post_search"
+POSTGRES_CONFIG = "english"
+BATCH_SIZE = 1000
+
+
+def _index_rows(cursor, vendor, rows):
+    rows = [(pk, title or "", content or "") for pk, title, content in rows]
+    if not rows:
+        return
+    if vendor == "sqlite":
+        cursor.executemany(
+            f"INSERT INTO {SQLITE_TABLE} (rowid, title, content) "
+            "VALUES (%s, %s, %s)",
+            rows,
+        )
+    else:
+        cursor.executemany(
+            f"INSERT INTO {POSTGRES_TABLE} (post_id, document) VALUES ("
+            "%s, setweight(to_tsvector(%s::regconfig, %s), 'A') || "
+            "setweight(to_tsvector(%s::regconfig, %s), 'B')) "
+            "ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document",
+            [
+                (pk, POSTGRES_CONFIG, title, POSTGRES_CONFIG, content)
+                for pk, title, content in rows
+            ],
+        )
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} "
+            "USING fts5(title, content, tokenize='porter unicode61')"
+        )
+    elif vendor == "postgresql":
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} ("
+            "post_id bigint PRIMARY KEY REFERENCES blog_post (id) "
+            "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {POSTGRES_TABLE}_document_gin "
+            f"ON {POSTGRES_TABLE} USING GIN (document)"
+        )
+    else:
+        return
+
+    Post = apps.get_model("blog", "Post")
+    rows = Post.objects.using(schema_editor.connection.alias).values_list(
+        "pk", "title", "content"
+    )
+    batch = []
+    with schema_editor.connection.cursor() as cursor:
+        for row in rows.iterator(chunk_size=BATCH_SIZE):
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                _index_rows(cursor, vendor, batch)
+                batch = []
+        _index_rows(cursor, vendor, batch)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SQLITE_TABLE}")
+    elif vendor == "postgresql":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {POSTGRES_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0002_post_published_at_post_blog_post_status_5b2843_idx"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="post",
+            options={"ordering": ["-published_at", "-created_at"]},
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0003_post_search_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["post", "-created_at", "-id"],
+                name="blog_commen_post_id_f18a65_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:17
+
+from django.db import migrations, models
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+# Frozen copy of blog.models.post_summary_fields as it was when this
+# migration was written; replaying it must not pick up later changes.
+EXCERPT_WORDS = 25
+META_DESCRIPTION_CHARS = 160
+
+
+def summary_fields(content):
+    content = content or ""
+    return {
+        "excerpt": Truncator(content).words(EXCERPT_WORDS),
+        "meta_description": Truncator(
+            " ".join(strip_tags(content).split())
+        ).chars(META_DESCRIPTION_CHARS),
+        "word_count": len(content.split()),
+    }
+
+
+def populate_summaries(apps, schema_editor):
+    Post = apps.get_model("blog", "Post")
+    manager = Post.objects.db_manager(schema_editor.connection.alias)
+    posts = manager.only("pk", "content").order_by("pk")
+    batch, pks = [], []
+    for post in posts.iterator(chunk_size=500):
+        for field, value in summary_fields(post.content).items():
+            setattr(post, field, value)
+        batch.append(post)
+        pks.append(post.pk)
+        if len(batch) >= 500:
+            manager.bulk_update(batch, ["excerpt", "meta_description", "word_count"])
+            batch = []
+    manager.bulk_update(batch, ["excerpt", "meta_description", "word_count"])
+    if pks:
+        schema_editor.connection.on_commit(lambda: retire_cached_cards(pks))
+
+
+def retire_cached_cards(pks):
+    """Cards and pages cached before the backfill show the old excerpts.
+
+    ``bulk_update`` leaves ``updated_at`` alone, so nothing else would
+    retire them. Cache versions are runtime state rather than schema, so
+    the live ``blog.caching`` is used, not a frozen copy.
+    """
+    from blog import caching
+
+    for pk in pks:
+        caching.bump("post", pk)
+    caching.bump("posts")
+
+
+def noop(apps, schema_editor):
+    """Reverse operation is a no-op; the columns are dropped anyway."""
+    return
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0004_comment_post_created_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="excerpt",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="meta_description",
+            field=models.CharField(blank=True, editable=False, max_length=160),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="word_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_summaries, noop),
+    ]
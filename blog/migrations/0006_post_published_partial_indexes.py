@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0005_post_summary_fields"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("status", "published")),
+                fields=["-published_at", "-created_at"],
+                name="post_published_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("status", "published")),
+                fields=["category", "-published_at", "-created_at"],
+                name="post_category_published_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0007_post_image_variants"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profile",
+            name="avatar_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:52
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count(rows):
+    counted = rows.order_by().annotate(n=Count("pk")).values("n")
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def populate_counters(apps, schema_editor):
+    Category = apps.get_model("blog", "Category")
+    Comment = apps.get_model("blog", "Comment")
+    Post = apps.get_model("blog", "Post")
+    Post.objects.update(
+        comment_count=_count(Comment.objects.filter(post=OuterRef("pk")).values("post"))
+    )
+    Category.objects.update(
+        published_post_count=_count(
+            Post.objects.filter(category=OuterRef("pk"), status="published").values(
+                "category"
+            )
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0010_outbound_email"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="published_post_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="comment_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
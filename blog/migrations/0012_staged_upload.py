@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0011_denormalized_counters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StagedUpload",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("name", models.CharField(max_length=255, unique=True)),
+                ("content", models.BinaryField()),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
@@ -1,9 +1,44 @@
+import math
+import re
+from collections import Counter
+
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Q
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Max, Q, Value, When
+from django.db.models.functions import Cast, Substr
 from django.urls import reverse
 from django.utils import timezone
-from django.utils.text import slugify
+from django.utils.html import strip_tags
+from django.utils.text import Truncator, slugify
+from django_cleanup import cleanup
+
+from . import counters, images
+
+EXCERPT_WORDS = 25
+META_DESCRIPTION_CHARS = 160
+WORDS_PER_MINUTE = 200
+
+SLUG_BASE_LENGTH = 160
+SLUG_ALLOCATION_ATTEMPTS = 5
+# Stay well under SQLite's 500-term limit on compound SELECTs.
+SLUG_QUERY_CHUNK = 200
+
+
+def post_summary_fields(content):
+    """Derived, display-ready fields for a post body.
+
+    Kept as a plain function so bulk imports and
+    ``backfill_post_summaries`` compute exactly what ``Post.save`` does.
+    Migration 0005 has its own frozen copy.
+    """
+    content = content or ""
+    return {
+        "excerpt": Truncator(content).words(EXCERPT_WORDS),
+        "meta_description": Truncator(
+            " ".join(strip_tags(content).split())
+        ).chars(META_DESCRIPTION_CHARS),
+        "word_count": len(content.split()),
+    }
 
 
 class PostQuerySet(models.QuerySet):
@@ -18,8 +53,86 @@ class PostQuerySet(models.QuerySet):
             published_at__lte=now,
         )
 
+    def _slug_suffix_query(self, base):
+        """One row: ``base`` and the highest suffix taken for it.
+
+        ``0`` means only the bare slug is taken, ``None`` that it is free.
+        The ``startswith`` bound turns this into a prefix scan of the slug
+        index (PostgreSQL's ``varchar_pattern_ops`` one) before the regex.
+        """
+        suffix = Case(
+            When(slug=base, then=Value(0)),
+            default=Cast(Substr("slug", len(base) + 2), models.BigIntegerField()),
+            output_field=models.BigIntegerField(),
+        )
+        return (
+            self.model._base_manager.filter(
+                slug__startswith=base,
+                slug__regex=rf"^{re.escape(base)}(-[0-9]+)?$",
+            )
+            .order_by()
+            .values(base=Value(base))
+            .annotate(top=Max(suffix))
+            .values_list("base", "top")
+        )
+
+    def allocate_slugs(self, titles):
+        """Return a free, unique slug for each title.
+
+        Costs one query per ``SLUG_QUERY_CHUNK`` distinct titles no matter
+        how many posts already share a slug, so bulk creation paths can
+        allocate a whole batch up front. Slugs are not reserved: callers
+        must still handle the rare ``IntegrityError`` from a concurrent
+        writer (``Post.save`` retries).
+        """
+        bases = [slug_base(title) for title in titles]
+        distinct = list(dict.fromkeys(bases))
+        taken = {}
+        for start in range(0, len(distinct), SLUG_QUERY_CHUNK):
+            first, *rest = [
+                self._slug_suffix_query(base)
+                for base in distinct[start:start + SLUG_QUERY_CHUNK]
+            ]
+            taken.update(first.union(*rest, all=True) if rest else first)
+
+        next_suffix = Counter()
+        slugs = []
+        for base in bases:
+            top = taken.get(base)
+            n = next_suffix[base] or (1 if top is None else max(top, 1) + 1)
+            next_suffix[base] = n + 1
+            slugs.append(base if n == 1 else f"{base}-{n}")
+        return slugs
+
+    def allocate_slug(self, title):
+        return self.allocate_slugs([title])[0]
+
+    def next_publication(self):
+        """When the earliest scheduled (future-dated) post goes live."""
+        return (
+            self.filter(
+                status=self.model.Status.PUBLISHED,
+                published_at__gt=timezone.now(),
+            )
+            .order_by("published_at")
+            .values_list("published_at", flat=True)
+            .first()
+        )
+
+    def for_listing(self):
+        """Skip the post body; cards and feeds use the precomputed fields."""
+        return self.defer("content")
+
     def visible_to(self, user):
-        """Limit queryset based on viewer permissions."""
+        """Limit queryset based on viewer permissions.
+
+        For authors the two ways a post can be visible are looked up
+        separately and combined with ``UNION``, so each half is served by
+        its own index (the published partial index and the author foreign
+        key) instead of an ``OR`` across columns that forces a scan. Single
+        posts should be fetched by slug and checked with
+        ``Post.is_visible_to`` instead.
+        """
         qs = self.select_related("author", "category")
 
         if not user.is_authenticated:
@@ -29,10 +142,16 @@ class PostQuerySet(models.QuerySet):
             return qs
 
         now = timezone.now()
-        return qs.filter(
-            Q(status=self.model.Status.PUBLISHED, published_at__lte=now)
-            | Q(author=user)
-        )
+        base = self.model._base_manager.order_by()
+        published = base.filter(
+            status=self.model.Status.PUBLISHED, published_at__lte=now
+        ).values("pk")
+        own = base.filter(author=user).values("pk")
+        return qs.filter(pk__in=published.union(own))
+
+
+def slug_base(title):
+    return slugify(title)[:SLUG_BASE_LENGTH] or "post"
 
 
 class TimeStamped(models.Model):
@@ -47,6 +166,9 @@ class Category(TimeStamped):
     name = models.CharField(max_length=60, unique=True)
     slug = models.SlugField(max_length=80, unique=True)
     description = models.TextField(blank=True)
+    # Live posts: published with ``published_at`` in the past. Scheduled
+    # ones are added when they go live (``blog.counters``).
+    published_post_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ["name"]
@@ -58,6 +180,8 @@ class Category(TimeStamped):
         return reverse("blog:category_detail", args=[self.slug])
 
 
+# Old files are removed by background jobs (``blog.media``), not inline.
+@cleanup.ignore
 class Profile(TimeStamped):
     user = models.OneToOneField(
         User,
@@ -66,12 +190,32 @@ class Profile(TimeStamped):
     )
     bio = models.TextField(blank=True)
     avatar = models.ImageField(upload_to="avatars/", blank=True, null=True)
+    # Manifest written by ``blog.images.generate_avatar_variants``.
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Staged upload a background job is still processing (``blog.media``).
+    pending_media = models.CharField(max_length=255, blank=True, editable=False)
     location = models.CharField(max_length=80, blank=True)
 
     def __str__(self) -> str:
         return self.user.username
 
+    def avatar_url(self, size):
+        """URL of the smallest processed avatar at least ``size`` px wide.
+
+        Falls back to the upload itself while it is still being processed,
+        and to ``None`` without an avatar.
+        """
+        if not self.avatar:
+            return None
+        if images.is_current(self.avatar, self.avatar_variants):
+            sizes = self.avatar_variants["sizes"]
+            fitting = sorted(int(s) for s in sizes if int(s) >= size)
+            chosen = fitting[0] if fitting else max(int(s) for s in sizes)
+            return self.avatar.storage.url(sizes[str(chosen)])
+        return self.avatar.url
 
+
+@cleanup.ignore
 class Post(TimeStamped):
     class Status(models.TextChoices):
         DRAFT = "draft", "Draft"
@@ -101,6 +245,19 @@ class Post(TimeStamped):
         default=Status.DRAFT,
     )
     published_at = models.DateTimeField(blank=True, null=True)
+    excerpt = models.TextField(blank=True, editable=False)
+    meta_description = models.CharField(
+        max_length=META_DESCRIPTION_CHARS,
+        blank=True,
+        editable=False,
+    )
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    # Manifest written by ``blog.images.generate_variants``.
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Staged upload a background job is still storing (``blog.media``).
+    pending_media = models.CharField(max_length=255, blank=True, editable=False)
+    # Maintained by ``blog.counters``.
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
 
     objects = PostQuerySet.as_manager()
 
@@ -110,6 +267,18 @@ class Post(TimeStamped):
             models.Index(fields=["slug"]),
             models.Index(fields=["status", "created_at"]),
             models.Index(fields=["status", "published_at"]),
+            # Listings only ever read published posts; these stay small and
+            # match the default ordering, so no sort step is needed.
+            models.Index(
+                fields=["-published_at", "-created_at"],
+                condition=Q(status="published"),
+                name="post_published_idx",
+            ),
+            models.Index(
+                fields=["category", "-published_at", "-created_at"],
+                condition=Q(status="published"),
+                name="post_category_published_idx",
+            ),
         ]
         constraints = [
             models.UniqueConstraint(
@@ -122,6 +291,12 @@ class Post(TimeStamped):
     def __str__(self) -> str:
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        counters.remember(instance, field_names)
+        return instance
+
     def get_absolute_url(self):
         return reverse("blog:post_detail", args=[self.slug])
 
@@ -133,20 +308,83 @@ class Post(TimeStamped):
             and self.published_at <= timezone.now()
         )
 
+    def is_visible_to(self, user) -> bool:
+        """In-memory counterpart of ``PostQuerySet.visible_to``."""
+        if self.is_public:
+            return True
+        if not user.is_authenticated:
+            return False
+        return user.is_staff or self.author_id == user.pk
+
+    @property
+    def reading_time(self) -> int:
+        """Estimated minutes to read, never less than one."""
+        return max(1, math.ceil(self.word_count / WORDS_PER_MINUTE))
+
+    def refresh_summary(self):
+        for field, value in post_summary_fields(self.content).items():
+            setattr(self, field, value)
+
+    def update_image_variants(self):
+        """Bring ``image_variants`` in line with ``featured_image``.
+
+        Returns whether anything changed. Writes with ``update()`` so it is
+        safe to call from ``post_save``.
+        """
+        if not self.featured_image:
+            variants = {}
+        elif images.is_current(self.featured_image, self.image_variants):
+            return False
+        else:
+            image = self.featured_image
+            with image.open("rb") as fh:
+                variants = images.generate_variants(fh, image.name, image.storage)
+        if variants == self.image_variants:
+            return False
+        self.image_variants = variants
+        Post.objects.filter(pk=self.pk).update(image_variants=variants)
+        return True
+
     def save(self, *args, **kwargs):
-        if not self.slug:
-            base = slugify(self.title)[:160]
-            slug = base
-            i = 2
-            while Post.objects.filter(slug=slug).exists():
-                slug = f"{base}-{i}"
-                i += 1
-            self.slug = slug
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            self.refresh_summary()
+        elif "content" in update_fields:
+            self.refresh_summary()
+            kwargs["update_fields"] = {
+                *update_fields,
+                "excerpt",
+                "meta_description",
+                "word_count",
+            }
 
         if self.status == self.Status.PUBLISHED and not self.published_at:
             self.published_at = timezone.now()
 
-        super().save(*args, **kwargs)
+        # The counter updates made by the signal handlers commit (or roll
+        # back) together with the row.
+        with transaction.atomic():
+            self._save_with_slug(*args, **kwargs)
+
+    def _save_with_slug(self, *args, **kwargs):
+        if self.slug:
+            super().save(*args, **kwargs)
+            return
+
+        self.slug = Post.objects.allocate_slug(self.title)
+        for attempt in range(SLUG_ALLOCATION_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                # A concurrent writer took the slug between allocation and
+                # insert; anything else (e.g. the title constraint) re-raises.
+                last = attempt == SLUG_ALLOCATION_ATTEMPTS - 1
+                if last or not Post.objects.filter(slug=self.slug).exists():
+                    self.slug = ""
+                    raise
+                self.slug = Post.objects.allocate_slug(self.title)
 
 
 class Comment(TimeStamped):
@@ -164,7 +402,98 @@ class Comment(TimeStamped):
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=["post", "-created_at", "-id"]),
+        ]
 
     def __str__(self) -> str:
         return f"Comment by {self.author} on {self.post}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        counters.remember(instance, field_names)
+        return instance
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class Job(TimeStamped):
+    """A unit of background work, run by ``manage.py run_worker``."""
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        RUNNING = "running", "Running"
+        FAILED = "failed", "Failed"
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["run_after", "id"]
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.task} #{self.pk} ({self.status})"
+
+
+class OutboundEmail(TimeStamped):
+    """A message waiting in the outbox (see ``blog.mail``)."""
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        SENDING = "sending", "Sending"
+        FAILED = "failed", "Failed"
+
+    subject = models.CharField(max_length=255)
+    recipients = models.CharField(max_length=255)
+    message = models.JSONField()
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["next_attempt_at", "id"]
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.subject} → {self.recipients} ({self.status})"
+
+
+class StagedUpload(TimeStamped):
+    """An upload waiting for a worker to store it (``blog.media``).
+
+    Kept in the database because it is the one store the web and worker
+    processes are sure to share.
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    content = models.BinaryField()
+
+    def __str__(self) -> str:
+        return self.name
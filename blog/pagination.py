@@ -0,0 +1,299 @@
+"""Cursor (keyset) pagination for post listings.
+
+``django.core.paginator.Paginator`` needs a ``COUNT(*)`` and an ``OFFSET``
+that grows with the page number. Here a page is addressed by the sort key of
+its boundary row instead, so every page costs one indexed range scan no
+matter how deep it is. Totals are optional and come from the cache.
+"""
+
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+from datetime import datetime
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+from django.utils.http import urlencode
+
+# ``?page=N`` links from before cursors existed keep working up to this
+# page; deeper ones, like pages past the end, are 404s.
+PAGE_COMPAT_LIMIT = 5
+# Deepest numbered page of search results; deeper ones are 404s too.
+OFFSET_PAGE_LIMIT = 100
+COUNT_CACHE_TIMEOUT = 300
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps(
+        {"d": direction, "k": [_encode_value(v) for v in values]},
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Return ``(values, direction)`` or ``None`` for a malformed token."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        direction = data["d"]
+        values = [_decode_value(v) for v in data["k"]]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        return None
+    if direction not in {"next", "prev"}:
+        return None
+    return values, direction
+
+
+class CursorPage(Sequence):
+    """One page of results plus the tokens needed to move either way."""
+
+    def __init__(self, object_list, *, has_next, has_previous,
+                 next_cursor=None, previous_cursor=None, number=None,
+                 total=None):
+        self.object_list = list(object_list)
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.number = number
+        self.total = total
+        self.next_url = None
+        self.previous_url = None
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class KeysetPaginator:
+    """Paginate ``queryset`` on a fixed, unique ordering.
+
+    ``ordering`` must end in a unique column (``-pk`` by default is appended)
+    and its columns must be non-null for the rows being paginated.
+    """
+
+    def __init__(self, queryset, per_page, ordering=None, count_cache_key=None):
+        ordering = list(ordering or queryset.model._meta.ordering)
+        if ordering[-1].lstrip("-") not in {"pk", "id"}:
+            ordering.append("-pk" if ordering[-1].startswith("-") else "pk")
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+        self.count_cache_key = count_cache_key
+
+    @property
+    def _fields(self):
+        return [f.lstrip("-") for f in self.ordering]
+
+    def _key(self, obj):
+        return [getattr(obj, f) for f in self._fields]
+
+    def _after(self, values, reverse=False):
+        """Q for rows strictly after ``values`` in (optionally reversed) order."""
+        q = Q()
+        for i, (field, value) in enumerate(zip(self.ordering, values)):
+            descending = field.startswith("-") != reverse
+            lookup = "lt" if descending else "gt"
+            name = field.lstrip("-")
+            term = Q(**{f"{name}__{lookup}": value})
+            for prev_field, prev_value in zip(self._fields[:i], values[:i]):
+                term &= Q(**{prev_field: prev_value})
+            q |= term
+        # A redundant bound on the leading column lets the planner turn the
+        # OR-chain into a single index range scan.
+        lead = self.ordering[0]
+        bound = "lte" if lead.startswith("-") != reverse else "gte"
+        return Q(**{f"{lead.lstrip('-')}__{bound}": values[0]}) & q
+
+    def total(self):
+        """Approximate row count, cached; ``None`` when no cache key is set."""
+        if not self.count_cache_key:
+            return None
+        return cache.get_or_set(
+            self.count_cache_key, self.queryset.count, COUNT_CACHE_TIMEOUT
+        )
+
+    def _build(self, rows, *, total, has_next, has_previous, number=None):
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = encode_cursor(self._key(rows[-1]), "next")
+        if rows and has_previous:
+            previous_cursor = encode_cursor(self._key(rows[0]), "prev")
+        return CursorPage(
+            rows,
+            has_next=has_next,
+            has_previous=has_previous,
+            next_cursor=next_cursor,
+            previous_cursor=previous_cursor,
+            number=number,
+            total=total,
+        )
+
+    def _cursor_query(self, cursor):
+        """``(queryset, reverse)`` for ``cursor``; ``None`` if it is invalid."""
+        decoded = decode_cursor(cursor)
+        if decoded is None or len(decoded[0]) != len(self.ordering):
+            return None
+
+        values, direction = decoded
+        reverse = direction == "prev"
+        ordering = self.ordering
+        if reverse:
+            ordering = [f[1:] if f.startswith("-") else f"-{f}" for f in ordering]
+        try:
+            qs = self.queryset.filter(self._after(values, reverse=reverse))
+        except (ValidationError, ValueError, TypeError):
+            # Tampered cursor carrying values of the wrong type.
+            return None
+        return qs.order_by(*ordering)[: self.per_page + 1], reverse
+
+    def _cursor_page(self, rows, reverse, total):
+        has_more = len(rows) > self.per_page
+        if not reverse:
+            return self._build(
+                rows[: self.per_page],
+                total=total,
+                has_next=has_more,
+                has_previous=True,
+            )
+        rows = rows[: self.per_page][::-1]
+        return self._build(rows, total=total, has_next=True, has_previous=has_more)
+
+    def page(self, cursor=None):
+        """Return the page addressed by ``cursor`` (first page if invalid)."""
+        query = self._cursor_query(cursor)
+        if query is None:
+            return self.page_number(1)
+        qs, reverse = query
+        try:
+            rows = list(qs)
+        except (ValidationError, ValueError, TypeError):
+            return self.page_number(1)
+        return self._cursor_page(rows, reverse, self.total())
+
+    def _number_query(self, number):
+        number = max(number, 1)
+        if number > PAGE_COMPAT_LIMIT:
+            raise Http404(f"Page {number} is only reachable by cursor.")
+        offset = (number - 1) * self.per_page
+        qs = self.queryset.order_by(*self.ordering)
+        return number, qs[offset: offset + self.per_page + 1]
+
+    def _number_page(self, rows, number, total):
+        if number > 1 and not rows:
+            raise Http404(f"Page {number} contains no results.")
+        return self._build(
+            rows[: self.per_page],
+            total=total,
+            has_next=len(rows) > self.per_page,
+            has_previous=number > 1,
+            number=number,
+        )
+
+    def page_number(self, number):
+        """OFFSET-based page for legacy ``?page=N`` links (no COUNT query)."""
+        number, qs = self._number_query(number)
+        return self._number_page(list(qs), number, self.total())
+
+
+class OffsetPaginator:
+    """Numbered pages without ``COUNT(*)``, for orderings keysets can't follow.
+
+    Used for relevance-ranked search results, where the match set is already
+    narrowed by the search index.
+    """
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def _query(self, number):
+        if number > OFFSET_PAGE_LIMIT:
+            raise Http404(f"Page {number} is past the last numbered page.")
+        offset = (number - 1) * self.per_page
+        return self.queryset[offset: offset + self.per_page + 1]
+
+    def _page(self, rows, number):
+        if number > 1 and not rows:
+            raise Http404(f"Page {number} contains no results.")
+        return CursorPage(
+            rows[: self.per_page],
+            has_next=len(rows) > self.per_page,
+            has_previous=number > 1,
+            number=number,
+        )
+
+    def page_number(self, number):
+        number = max(number, 1)
+        return self._page(list(self._query(number)), number)
+
+
+def _page_param(request):
+    try:
+        return int(request.GET.get("page") or 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def _link(request, **params):
+    query = request.GET.copy()
+    query.pop("page", None)
+    query.pop("cursor", None)
+    query.update({k: v for k, v in params.items() if v is not None})
+    return f"?{urlencode(sorted(query.lists()), doseq=True)}"
+
+
+def _add_links(request, page, offset):
+    if offset:
+        if page.has_next:
+            page.next_url = _link(request, page=page.number + 1)
+        if page.has_previous:
+            page.previous_url = _link(request, page=page.number - 1)
+        return page
+
+    if page.has_next:
+        page.next_url = _link(request, cursor=page.next_cursor)
+    if page.has_previous:
+        if page.number and page.number > 1:
+            page.previous_url = _link(request, page=page.number - 1)
+        else:
+            page.previous_url = _link(request, cursor=page.previous_cursor)
+    return page
+
+
+def paginate(request, paginator):
+    """Resolve ``?cursor=`` / ``?page=`` from ``request`` into a page.
+
+    The page carries ready-made ``next_url`` / ``previous_url`` links that
+    keep the rest of the query string (e.g. ``q``).
+    """
+    offset = isinstance(paginator, OffsetPaginator)
+    cursor = None if offset else request.GET.get("cursor")
+    if cursor:
+        page = paginator.page(cursor)
+    else:
+        page = paginator.page_number(_page_param(request))
+    return _add_links(request, page, offset)
@@ -0,0 +1,199 @@
+"""Where a request's time goes.
+
+``timed(bucket)`` adds the time spent in a block to the current request's
+``Timings``; ``instrument()`` wraps Django's template rendering, the
+media storage's methods and opening database connections (with a pool:
+waiting for one) so that ``template``, ``storage`` and ``connect`` are
+filled in without touching call sites. Buckets overlap: a query run while
+a template renders counts towards both ``db`` and ``template``.
+
+Profiles are written as ``pstats`` files, either from ``cProfile`` or from
+``StackSampler``, a statistical profiler cheap enough to leave on for every
+request so that only slow ones need to be kept. ``manage.py
+profile_report`` aggregates them.
+"""
+
+import marshal
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+
+from django.core.files.storage import storages
+from django.db import connections
+from django.template.base import Template
+from django.utils import timezone
+
+BUCKETS = ("db", "connect", "template", "storage")
+STORAGE_METHODS = ("url", "exists", "open", "save", "delete", "size", "listdir")
+SAMPLE_INTERVAL_MS = 5
+
+
+class Timings:
+    """Seconds spent per bucket during one request."""
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.calls = Counter()
+        self._active = Counter()
+
+    def header(self, total, query_stats=None):
+        """The ``Server-Timing`` value; durations are in milliseconds."""
+        parts = []
+        if query_stats is not None:
+            parts.append(
+                f'db;desc="{query_stats.count} queries";'
+                f"dur={query_stats.time_ms:.1f}"
+            )
+        for bucket in BUCKETS:
+            if bucket in self.durations:
+                parts.append(
+                    f'{bucket};desc="{self.calls[bucket]} calls";'
+                    f"dur={self.durations[bucket] * 1000:.1f}"
+                )
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+# Like the query stats, this follows the request into sync_to_async threads.
+_current = ContextVar("blog_timings", default=None)
+
+
+def start():
+    """Begin timing a request; pass the token to ``stop()``."""
+    timings = Timings()
+    return timings, _current.set(timings)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+@contextmanager
+def timed(bucket):
+    """Count the block towards ``bucket``; nested blocks count once."""
+    timings = _current.get()
+    if timings is None or timings._active[bucket]:
+        yield
+        return
+    timings._active[bucket] += 1
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings._active[bucket] -= 1
+        timings.durations[bucket] += time.perf_counter() - began
+        timings.calls[bucket] += 1
+
+
+def _timed_function(func, bucket):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with timed(bucket):
+            return func(*args, **kwargs)
+
+    wrapper._blog_timed = True
+    return wrapper
+
+
+def _wrap(cls, names, bucket):
+    for name in names:
+        func = getattr(cls, name, None)
+        if func is not None and not getattr(func, "_blog_timed", False):
+            setattr(cls, name, _timed_function(func, bucket))
+
+
+def instrument():
+    """Time templates, storage calls and connecting (idempotent)."""
+    _wrap(Template, ["render"], "template")
+    _wrap(type(storages["default"]), STORAGE_METHODS, "storage")
+    for alias in connections:
+        _wrap(type(connections[alias]), ["get_new_connection"], "connect")
+
+
+class StackSampler:
+    """Statistical profiler for one thread.
+
+    A background thread looks at the target thread's stack every
+    ``interval`` seconds. The result has the ``pstats`` layout, with each
+    sample standing in for ``interval`` seconds; call counts are sample
+    counts.
+    """
+
+    def __init__(self, thread_id=None, interval=SAMPLE_INTERVAL_MS / 1000):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.own = Counter()
+        self.cumulative = Counter()
+        self.edges = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample(sys._current_frames().get(self.thread_id))
+
+    def sample(self, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        if not stack:
+            return
+        self.own[stack[0]] += 1
+        self.cumulative.update(set(stack))
+        self.edges.update(zip(stack[1:], stack))
+
+    def stats(self):
+        callers = defaultdict(dict)
+        for (caller, callee), n in self.edges.items():
+            callers[callee][caller] = (n, n, 0.0, n * self.interval)
+        return {
+            func: (
+                n,
+                n,
+                self.own[func] * self.interval,
+                n * self.interval,
+                callers[func],
+            )
+            for func, n in self.cumulative.items()
+        }
+
+    def dump_stats(self, path):
+        with open(path, "wb") as fh:
+            marshal.dump(self.stats(), fh)
+
+
+def path_slug(path):
+    return re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_")[:60] or "root"
+
+
+def profile_name(request, elapsed, kind):
+    """``<UTC time>-<method>-<path>-<ms>ms-<kind>.prof``; sorts by time."""
+    path = path_slug(request.path)
+    stamp = timezone.now().strftime("%Y%m%dT%H%M%S%f")
+    ms = f"{elapsed * 1000:.0f}ms"
+    return f"{stamp}-{request.method}-{path}-{ms}-{kind}.prof"
+
+
+def save(profiler, directory, request, elapsed, kind):
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    target = directory / profile_name(request, elapsed, kind)
+    profiler.dump_stats(target)
+    return target
+
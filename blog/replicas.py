@@ -0,0 +1,180 @@
+"""Read replicas.
+
+``ReplicaRouter`` sends reads of the blog's content (posts, categories,
+comments, profiles) made while serving a ``GET`` to one of
+``BLOG_READ_REPLICAS``. Writes, and every other read (sessions, users, the
+job queue, the outbox, anything a worker or command does), stay on
+``default``.
+
+Replicas trail the primary. To keep readers from seeing stale data:
+
+* A replica whose lag is over ``BLOG_REPLICA_MAX_LAG_SECONDS`` is skipped
+  until it catches up. Each process checks a replica's lag at most every
+  ``LAG_CHECK_INTERVAL`` seconds; only PostgreSQL reports it, other
+  backends count as current.
+* Reads inside a transaction on the primary stay there.
+* Anything cached under the current version keys (``blog.caching``) is
+  built from the primary (``primary_reads()``): a write bumps the versions
+  at once, and a replica that has not replayed it yet would fill the new
+  keys with the old content until they expire.
+* ``ReplicaMiddleware`` reads from the primary for a request that writes
+  (``POST`` and friends) and, through a cookie, for that browser's
+  requests during the next ``pin_seconds()``. That is long enough for a
+  replica that is not skipped to have caught up, so the page a form
+  redirects to shows what was just saved.
+"""
+
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import SynchronousOnlyOperation
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+REPLICATED_MODELS = {"blog.post", "blog.category", "blog.comment", "blog.profile"}
+MAX_LAG_SECONDS = 5
+LAG_CHECK_INTERVAL = 5
+PIN_COOKIE = "blog_primary"
+
+# 0 when the replica has replayed everything it received; NULL (so 0) on a
+# server that is not a standby.
+LAG_SQL = {
+    "postgresql": (
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+        "THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) "
+        "END"
+    ),
+}
+
+
+def replicas():
+    return getattr(settings, "BLOG_READ_REPLICAS", [])
+
+
+def max_lag():
+    return getattr(settings, "BLOG_REPLICA_MAX_LAG_SECONDS", MAX_LAG_SECONDS)
+
+
+def pin_seconds():
+    """How long a browser reads from the primary after it writes.
+
+    A replica's lag can grow for up to ``LAG_CHECK_INTERVAL`` after it was
+    last measured under the limit.
+    """
+    return max_lag() + LAG_CHECK_INTERVAL
+
+
+def measure_lag(alias):
+    """Seconds ``alias`` trails the primary, or ``None`` if it is down."""
+    connection = connections[alias]
+    sql = LAG_SQL.get(connection.vendor)
+    if sql is None:
+        return 0.0
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            (lag,) = cursor.fetchone()
+    except DatabaseError:
+        return None
+    return float(lag or 0)
+
+
+_lag = {}
+_lag_lock = threading.Lock()
+
+
+def lag(alias):
+    """``measure_lag(alias)``, measured at most every ``LAG_CHECK_INTERVAL``."""
+    now = time.monotonic()
+    checked_at, seconds = _lag.get(alias, (None, None))
+    if checked_at is not None and now - checked_at < LAG_CHECK_INTERVAL:
+        return seconds
+    with _lag_lock:
+        try:
+            seconds = measure_lag(alias)
+        except SynchronousOnlyOperation:
+            # On the event loop: keep the last answer until a thread asks.
+            return seconds
+        _lag[alias] = (now, seconds)
+    return seconds
+
+
+def choose_replica():
+    """A replica within the lag limit, or ``None`` for the primary."""
+    limit = max_lag()
+    current = [
+        alias
+        for alias in replicas()
+        if (seconds := lag(alias)) is not None and seconds <= limit
+    ]
+    return random.choice(current) if current else None
+
+
+class _Reads:
+    """The replica one request reads from, chosen on its first read."""
+
+    def __init__(self):
+        self.alias = None
+        self.chosen = False
+
+    def alias_for_read(self):
+        if not self.chosen:
+            self.alias = choose_replica()
+            self.chosen = True
+        return self.alias
+
+
+# Follows the request into sync_to_async threads, where the queries run.
+_reads = ContextVar("blog_replica_reads", default=None)
+
+
+@contextmanager
+def replica_reads():
+    """Let the block's reads of ``REPLICATED_MODELS`` go to a replica."""
+    token = _reads.set(_Reads())
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Keep the block's reads on the primary, even inside ``replica_reads()``."""
+    token = _reads.set(None)
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+def read_from_replica():
+    """Whether this request has read content from a replica."""
+    reads = _reads.get()
+    return reads is not None and reads.alias is not None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        reads = _reads.get()
+        if reads is None or model._meta.label_lower not in REPLICATED_MODELS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # The transaction may have written what is about to be read.
+            return None
+        return reads.alias_for_read()
+
+    def db_for_write(self, model, **hints):
+        # Also for instances that were read from a replica.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary.
+        return False if db in replicas() else None
@@ -0,0 +1,222 @@
+"""Full-text search over posts.
+
+Each post is mirrored into a search index that lives next to ``blog_post``:
+an FTS5 virtual table on SQLite and a ``tsvector`` table with a GIN index on
+PostgreSQL. The index is kept in sync from the post signals, and queries are
+always applied on top of an existing ``Post`` queryset so callers keep the
+visibility rules of ``PostQuerySet.published()``.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+SQLITE_TABLE = "blog_post_fts"
+POSTGRES_TABLE = "blog_post_search"
+POSTGRES_CONFIG = "english"
+
+# Private-use code points survive both FTS engines untouched and can never
+# appear in escaped output, so highlights are swapped for <mark> after escaping.
+_MARK_START = "\ue000"
+_MARK_END = "\ue001"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _vendor(conn=None):
+    return (conn or connection).vendor
+
+
+def is_supported(conn=None):
+    return _vendor(conn) in {"sqlite", "postgresql"}
+
+
+def index_posts(rows, conn=None):
+    """Upsert ``(id, title, content)`` rows into the search index."""
+    conn = conn or connection
+    rows = [(pk, title or "", content or "") for pk, title, content in rows]
+    if not rows or not is_supported(conn):
+        return
+    with conn.cursor() as cursor:
+        if conn.vendor == "sqlite":
+            cursor.executemany(
+                f"DELETE FROM {SQLITE_TABLE} WHERE rowid = %s",
+                [(pk,) for pk, _, _ in rows],
+            )
+            cursor.executemany(
+                f"INSERT INTO {SQLITE_TABLE} (rowid, title, content) "
+                "VALUES (%s, %s, %s)",
+                rows,
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {POSTGRES_TABLE} (post_id, document) VALUES ("
+                "%s, setweight(to_tsvector(%s::regconfig, %s), 'A') || "
+                "setweight(to_tsvector(%s::regconfig, %s), 'B')) "
+                "ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document",
+                [
+                    (pk, POSTGRES_CONFIG, title, POSTGRES_CONFIG, content)
+                    for pk, title, content in rows
+                ],
+            )
+
+
+def index_post(post):
+    index_posts([(post.pk, post.title, post.content)])
+
+
+def remove_posts(post_ids, conn=None):
+    conn = conn or connection
+    post_ids = list(post_ids)
+    if not post_ids or not is_supported(conn):
+        return
+    table, column = (
+        (SQLITE_TABLE, "rowid")
+        if conn.vendor == "sqlite"
+        else (POSTGRES_TABLE, "post_id")
+    )
+    with conn.cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {table} WHERE {column} = %s",
+            [(pk,) for pk in post_ids],
+        )
+
+
+def rebuild_index(batch_size=1000):
+    """Re-index every post; returns the number of rows written."""
+    from .models import Post
+
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(f"DELETE FROM {SQLITE_TABLE}")
+        elif connection.vendor == "postgresql":
+            cursor.execute(f"TRUNCATE {POSTGRES_TABLE}")
+
+    total = 0
+    batch = []
+    rows = Post.objects.order_by("pk").values_list("pk", "title", "content")
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            index_posts(batch)
+            total += len(batch)
+            batch = []
+    index_posts(batch)
+    return total + len(batch)
+
+
+def _sqlite_match(q):
+    """Turn free text into a safe FTS5 expression (AND of quoted terms)."""
+    tokens = _TOKEN_RE.findall(q)
+    if not tokens:
+        return ""
+    terms = [f'"{t}"' for t in tokens]
+    # Let the last word act as a prefix so partially typed queries match.
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search(queryset, q):
+    """Filter ``queryset`` to posts matching ``q``, ordered by relevance.
+
+    The returned queryset is annotated with ``search_rank`` (higher is
+    better). Databases without a search index fall back to ``icontains``.
+    """
+    q = (q or "").strip()
+    if not q:
+        return queryset
+
+    vendor = _vendor()
+    table = queryset.model._meta.db_table
+
+    # The index table is joined (rather than probed per row) so the engine
+    # drives the query from the FTS/GIN index and ranks in the same pass.
+    if vendor == "sqlite":
+        match = _sqlite_match(q)
+        if not match:
+            return queryset.none()
+        ranked = queryset.extra(
+            tables=[SQLITE_TABLE],
+            where=[
+                f"{SQLITE_TABLE}.rowid = {table}.id",
+                f"{SQLITE_TABLE} MATCH %s",
+            ],
+            params=[match],
+            # bm25() is "lower is better"; negate it so both backends sort DESC.
+            select={"search_rank": f"-bm25({SQLITE_TABLE}, 10.0, 1.0)"},
+        )
+    elif vendor == "postgresql":
+        tsquery = "websearch_to_tsquery(%s::regconfig, %s)"
+        ranked = queryset.extra(
+            tables=[POSTGRES_TABLE],
+            where=[
+                f"{POSTGRES_TABLE}.post_id = {table}.id",
+                f"{POSTGRES_TABLE}.document @@ {tsquery}",
+            ],
+            params=[POSTGRES_CONFIG, q],
+            select={"search_rank": f"ts_rank_cd({POSTGRES_TABLE}.document, {tsquery})"},
+            select_params=[POSTGRES_CONFIG, q],
+        )
+    else:
+        return queryset.filter(Q(title__icontains=q) | Q(content__icontains=q))
+
+    return ranked.order_by("-search_rank", *queryset.model._meta.ordering)
+
+
+def _render_snippet(raw):
+    html = escape(raw or "")
+    html = html.replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+    return mark_safe(html)
+
+
+def highlight(posts, q):
+    """Attach a ``search_snippet`` with ``<mark>``-ed terms to each post.
+
+    Only the posts being rendered (one page) are highlighted, so the cost
+    does not depend on how many posts matched.
+    """
+    posts = list(posts)
+    q = (q or "").strip()
+    if not posts or not q:
+        return posts
+
+    ids = [p.pk for p in posts]
+    placeholders = ", ".join(["%s"] * len(ids))
+    snippets = {}
+    vendor = _vendor()
+
+    with connection.cursor() as cursor:
+        if vendor == "sqlite":
+            match = _sqlite_match(q)
+            if match:
+                cursor.execute(
+                    f"SELECT rowid, snippet({SQLITE_TABLE}, 1, %s, %s, '…', 24) "
+                    f"FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s "
+                    f"AND rowid IN ({placeholders})",
+                    [_MARK_START, _MARK_END, match, *ids],
+                )
+                snippets = dict(cursor.fetchall())
+        elif vendor == "postgresql":
+            cursor.execute(
+                "SELECT id, ts_headline(%s::regconfig, content, "
+                "websearch_to_tsquery(%s::regconfig, %s), %s) "
+                f"FROM blog_post WHERE id IN ({placeholders})",
+                [
+                    POSTGRES_CONFIG,
+                    POSTGRES_CONFIG,
+                    q,
+                    f"StartSel={_MARK_START}, StopSel={_MARK_END}, "
+                    "MaxWords=30, MinWords=12, MaxFragments=2, "
+                    "FragmentDelimiter=\" … \"",
+                    *ids,
+                ],
+            )
+            snippets = dict(cursor.fetchall())
+
+    for post in posts:
+        raw = snippets.get(post.pk)
+        post.search_snippet = _render_snippet(raw) if raw else ""
+    return posts
@@ -1,7 +1,8 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Profile
+from .models import Category, Comment, Post, Profile
+from . import caching, counters, images, media, search, tasks
 from django.contrib.auth import get_user_model
 
 
@@ -10,6 +11,119 @@ User = get_user_model()
 
 
 @receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created:
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    # Fixtures and backups bring the profile along.
+    if created and not raw:
         Profile.objects.create(user=instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_author_fragments(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        # Every login saves the user; nothing public shows ``last_login``.
+        return
+    caching.bump("author", instance.pk)
+    caching.bump("authors")
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_profile_pages(sender, instance, **kwargs):
+    caching.bump("author", instance.user_id)
+    caching.bump("authors")
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Profile)
+def stage_media(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    media.prepare(instance, update_fields)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Profile)
+def queue_media_jobs(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    media.finish(instance)
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Profile)
+def discard_media(sender, instance, **kwargs):
+    media.discard(instance)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_fragments(sender, instance, **kwargs):
+    caching.bump("category", instance.pk)
+    caching.bump("categories")
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, **kwargs):
+    caching.bump("comments")
+    # Cards show the post's comment count.
+    caching.bump("post", instance.post_id)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    counters.comment_saved(instance, created)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, origin=None, **kwargs):
+    counters.comment_deleted(instance, origin)
+
+
+@receiver(pre_save, sender=Post)
+def snapshot_post_counters(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    counters.post_saving(instance)
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    counters.post_saved(instance)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    counters.post_deleted(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_fragments(sender, instance, **kwargs):
+    caching.bump("post", instance.pk)
+    caching.bump("posts")
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_post(instance)
+
+
+@receiver(post_save, sender=Post)
+def build_image_variants(sender, instance, raw=False, **kwargs):
+    if raw or instance.pending_media or not instance.featured_image:
+        return
+    if not images.is_current(instance.featured_image, instance.image_variants):
+        tasks.enqueue(media.build_post_image_variants, pk=instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.remove_posts([instance.pk])
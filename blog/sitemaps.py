@@ -1,22 +1,114 @@
 from django.contrib.sitemaps import Sitemap
+from django.contrib.sitemaps.views import sitemap
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db.models import Count, Max
+from django.http import HttpResponse
 from django.urls import reverse
+from django.utils.functional import cached_property
 
+from . import caching, replicas
 from .models import Category, Post
 
+SITEMAP_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def post_state():
+    """Latest ``updated_at`` and highest ``pk`` of the published posts, cached.
+
+    The sitemap index needs both on every request. Like ``feeds.feed_state``
+    the entry is keyed on the global posts version and expires when the
+    next scheduled post goes live; it is computed on the primary.
+    """
+    key = f"blog:sitemap:posts:{caching.version('posts')}"
+    state = cache.get(key)
+    if state is None:
+        with replicas.primary_reads():
+            state = (
+                Post.objects.published()
+                .order_by()
+                .aggregate(last=Max("updated_at"), top=Max("pk"))
+            )
+            timeout = caching.timeout_until(
+                Post.objects.next_publication(), SITEMAP_CACHE_TIMEOUT
+            )
+        cache.set(key, state, timeout)
+    return state
+
+
+def _fingerprint(queryset):
+    state = queryset.order_by().aggregate(last=Max("updated_at"), count=Count("pk"))
+    last = state["last"].timestamp() if state["last"] else 0
+    return f"{last}-{state['count']}"
+
+
+class IdRangePaginator(Paginator):
+    """Split a queryset into fixed ``pk`` ranges instead of OFFSET pages.
+
+    Page ``n`` holds rows with ``(n - 1) * per_page < pk <= n * per_page``,
+    so it never has more than ``per_page`` rows, needs no ``COUNT(*)`` and
+    costs the same however deep it is. Rows are streamed with a server-side
+    cursor. Gaps from drafts or deleted posts just make a page shorter; the
+    last page is the one holding the highest ``pk`` in the queryset, which
+    is looked up unless the caller already knows it (``top``).
+    """
+
+    def __init__(self, object_list, per_page, chunk_size=2000, top=None):
+        super().__init__(object_list, per_page)
+        self.chunk_size = chunk_size
+        self.top = top
+
+    @cached_property
+    def num_pages(self):
+        top = self.top
+        if top is None:
+            top = self.object_list.order_by().aggregate(top=Max("pk"))["top"]
+        return max(1, -(-(top or 0) // self.per_page))
+
+    def page_range_filter(self, number):
+        return {
+            "pk__gt": (number - 1) * self.per_page,
+            "pk__lte": number * self.per_page,
+        }
+
+    def page(self, number):
+        number = self.validate_number(number)
+        rows = self.object_list.filter(**self.page_range_filter(number))
+        return Page(rows.iterator(chunk_size=self.chunk_size), number, self)
+
 
 class PostSitemap(Sitemap):
     changefreq = "weekly"
     priority = 0.8
+    limit = 50000
 
     def items(self):
-        return Post.objects.published()
+        return (
+            Post.objects.published()
+            .select_related(None)
+            .only("slug", "updated_at")
+            .order_by("pk")
+        )
+
+    @property
+    def paginator(self):
+        return IdRangePaginator(
+            self.items(), self.limit, top=post_state()["top"] or 0
+        )
 
     def lastmod(self, obj):
-        return getattr(obj, "updated_at", obj.created_at)
+        return obj.updated_at
 
     def location(self, obj):
         return obj.get_absolute_url()
 
+    def get_latest_lastmod(self):
+        return post_state()["last"]
+
+    def cache_fingerprint(self, page):
+        page_filter = self.paginator.page_range_filter(page)
+        return _fingerprint(self.items().filter(**page_filter))
+
 
 class CategorySitemap(Sitemap):
     changefreq = "weekly"
@@ -28,6 +120,9 @@ class CategorySitemap(Sitemap):
     def location(self, obj):
         return obj.get_absolute_url()
 
+    def cache_fingerprint(self, page):
+        return _fingerprint(Category.objects.all())
+
 
 class StaticSitemap(Sitemap):
     changefreq = "weekly"
@@ -38,3 +133,52 @@ class StaticSitemap(Sitemap):
 
     def location(self, name):
         return reverse(name)
+
+    def cache_fingerprint(self, page):
+        return "static"
+
+
+def cached_sitemap(request, sitemaps, section, **kwargs):
+    """``django.contrib.sitemaps.views.sitemap`` with per-section caching.
+
+    Each section page is cached under a fingerprint of the rows it covers
+    (latest ``updated_at`` and row count), so it is only rebuilt when one
+    of its own posts changes, goes live or disappears. A replica that
+    trails the primary only delays that by its lag, as the page it misses
+    on is rebuilt from the primary.
+    """
+    site = sitemaps.get(section)
+    if callable(site):
+        site = site()
+    try:
+        page = int(request.GET.get("p", 1))
+    except (TypeError, ValueError):
+        page = None
+    if site is None or page is None or not hasattr(site, "cache_fingerprint"):
+        return sitemap(request, sitemaps, section=section, **kwargs)
+
+    key = ":".join(
+        [
+            "blog:sitemap",
+            section,
+            str(page),
+            site.cache_fingerprint(page),
+            request.scheme,
+            request.get_host(),
+        ]
+    )
+    cached = cache.get(key)
+    if cached is not None:
+        content, headers = cached
+        return HttpResponse(content, headers=headers)
+
+    with replicas.primary_reads():
+        response = sitemap(request, {section: site}, section=section, **kwargs)
+        response.render()
+    if response.status_code == 200:
+        cache.set(
+            key,
+            (response.content, dict(response.headers)),
+            SITEMAP_CACHE_TIMEOUT,
+        )
+    return response
@@ -0,0 +1,169 @@
+"""A small database-backed job queue.
+
+Work that should not hold up a request is registered with ``@register``
+and queued with ``enqueue``. The job row is written in the caller's
+transaction, so it only becomes visible once the data it refers to is
+committed. ``manage.py run_worker`` claims and runs jobs and retries
+failures with exponential backoff. No broker is needed; the jobs live in
+the same database as everything else.
+
+Set ``BLOG_TASKS_EAGER = True`` to skip the queue and run each job in
+process right after commit (tests, local debugging).
+"""
+
+import logging
+import os
+import random
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+REGISTRY = {}
+GIVE_UP = {}
+
+BACKOFF_BASE = 30
+BACKOFF_MAX = 60 * 60
+# A running job whose worker has been silent this long is assumed dead.
+LOCK_TIMEOUT = timedelta(minutes=15)
+CLAIM_CANDIDATES = 10
+
+
+def register(func):
+    """Make ``func`` runnable as a job under its name."""
+    REGISTRY[func.__name__] = func
+    return func
+
+
+def on_give_up(task):
+    """Register a cleanup called with the payload once ``task`` has failed
+    for the last time."""
+
+    def decorator(func):
+        GIVE_UP[task.__name__] = func
+        return func
+
+    return decorator
+
+
+def enqueue(func, *, delay=0, max_attempts=5, **payload):
+    """Queue ``func(**payload)``; ``payload`` must be JSON-serializable."""
+    from .models import Job
+
+    name = func if isinstance(func, str) else func.__name__
+    if name not in REGISTRY:
+        raise LookupError(f"Unknown task {name!r}")
+    if getattr(settings, "BLOG_TASKS_EAGER", False):
+        transaction.on_commit(lambda: REGISTRY[name](**payload))
+        return None
+    return Job.objects.create(
+        task=name,
+        payload=payload,
+        max_attempts=max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def backoff(attempts):
+    """Seconds to wait before retry number ``attempts``, with jitter."""
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _ready(now):
+    from .models import Job
+
+    return Q(status=Job.Status.PENDING, run_after__lte=now) | Q(
+        status=Job.Status.RUNNING, locked_at__lt=now - LOCK_TIMEOUT
+    )
+
+
+def claim(worker):
+    """Lock the next runnable job for ``worker``; ``None`` if there is none.
+
+    PostgreSQL hands each worker a different row with ``SKIP LOCKED``;
+    elsewhere a conditional ``UPDATE`` makes sure only one worker wins.
+    """
+    from .models import Job
+
+    now = timezone.now()
+    ready = Job.objects.filter(_ready(now)).order_by("run_after", "pk")
+    lock = {
+        "status": Job.Status.RUNNING,
+        "locked_by": worker,
+        "locked_at": now,
+        "attempts": F("attempts") + 1,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pk = (
+                ready.select_for_update(skip_locked=True)
+                .values_list("pk", flat=True)
+                .first()
+            )
+            if pk is None:
+                return None
+            Job.objects.filter(pk=pk).update(**lock)
+        return Job.objects.get(pk=pk)
+
+    for pk in ready.values_list("pk", flat=True)[:CLAIM_CANDIDATES]:
+        if Job.objects.filter(_ready(now), pk=pk).update(**lock):
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def run_job(job):
+    """Run a claimed job; returns whether it succeeded.
+
+    Successful jobs are deleted. Failures are rescheduled with backoff
+    until ``max_attempts`` is reached, then kept as ``failed`` and handed
+    to the task's ``on_give_up`` cleanup, if it has one.
+    """
+    from .models import Job
+
+    mine = Job.objects.filter(pk=job.pk, locked_by=job.locked_by)
+    try:
+        func = REGISTRY.get(job.task)
+        if func is None:
+            raise LookupError(f"Unknown task {job.task!r}")
+        func(**job.payload)
+    except Exception:
+        logger.exception("Job %s failed (attempt %s)", job, job.attempts)
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            mine.update(status=Job.Status.FAILED, last_error=error, locked_by="")
+            _give_up(job)
+        else:
+            mine.update(
+                status=Job.Status.PENDING,
+                run_after=timezone.now()
+                + timedelta(seconds=backoff(job.attempts)),
+                last_error=error,
+                locked_by="",
+                locked_at=None,
+            )
+        return False
+    mine.delete()
+    return True
+
+
+
+def _give_up(job):
+    cleanup = GIVE_UP.get(job.task)
+    if cleanup is None:
+        return
+    try:
+        cleanup(**job.payload)
+    except Exception:
+        logger.exception("Cleanup for failed job %s failed", job)
@@ -0,0 +1,130 @@
+from django import template
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from .. import caching, images, replicas
+
+register = template.Library()
+
+POST_CARD_TEMPLATE = "blog/partials/_post_card.html"
+POST_CARD_TIMEOUT = 60 * 60 * 24
+DEFAULT_AVATAR = "img/default-avatar.png"
+
+
+def _card_key(post, variant, versions):
+    return ":".join(
+        [
+            "blog:card",
+            variant,
+            str(post.pk),
+            str(post.updated_at.timestamp()),
+            f"p{versions[('post', post.pk)]}",
+            f"c{versions[('category', post.category_id)]}",
+            f"a{versions[('author', post.author_id)]}",
+        ]
+    )
+
+
+@register.simple_tag
+def post_cards(posts, variant="home"):
+    """Render a list of post cards, serving each card from the cache.
+
+    All keys for the page are fetched with a single ``get_many`` so a listing
+    costs a couple of cache round-trips however many cards it shows. Search
+    results carry per-query snippets and are always rendered fresh.
+    """
+    posts = list(posts)
+    cacheable = [p for p in posts if not getattr(p, "search_snippet", "")]
+
+    pairs = set()
+    for post in cacheable:
+        pairs.update(
+            [
+                ("post", post.pk),
+                ("category", post.category_id),
+                ("author", post.author_id),
+            ]
+        )
+    versions = caching.versions(pairs) if pairs else {}
+    keys = {post.pk: _card_key(post, variant, versions) for post in cacheable}
+    cached = cache.get_many(keys.values()) if keys else {}
+
+    rendered, fresh = [], {}
+    for post in posts:
+        key = keys.get(post.pk)
+        html = cached.get(key) if key else None
+        if html is None:
+            html = render_to_string(
+                POST_CARD_TEMPLATE, {"post": post, "variant": variant}
+            )
+            if key:
+                fresh[key] = html
+        rendered.append(html)
+
+    # Rows read from a replica may predate the versions in their keys.
+    if fresh and not replicas.read_from_replica():
+        cache.set_many(fresh, POST_CARD_TIMEOUT)
+    if keys:
+        caching.record(
+            "post_card", hits=len(keys) - len(fresh), misses=len(fresh)
+        )
+    return mark_safe("".join(rendered))
+
+
+def _srcset(storage, entries):
+    return ", ".join(f"{storage.url(e['name'])} {e['width']}w" for e in entries)
+
+
+@register.simple_tag
+def responsive_image(image, variants, sizes="100vw", alt="", css_class="",
+                     loading="lazy"):
+    """``<picture>`` for ``image`` built from its derivative manifest.
+
+    Until derivatives exist (or if they belong to a replaced file) this is
+    a plain ``<img>`` of the original upload.
+    """
+    if not image:
+        return ""
+    if not images.is_current(image, variants):
+        return format_html(
+            '<img class="{}" src="{}" alt="{}" loading="{}" decoding="async">',
+            css_class, image.url, alt, loading,
+        )
+
+    storage = image.storage
+    sources = variants["sources"]
+    alternatives = format_html_join(
+        "",
+        '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (mime, _srcset(storage, sources[mime]), sizes)
+            for mime, *_ in images.FORMATS
+            if mime != images.FALLBACK_TYPE and mime in sources
+        ),
+    )
+    fallback = sources[images.FALLBACK_TYPE]
+    largest = fallback[-1]
+    return format_html(
+        "<picture>{}<img class=\"{}\" src=\"{}\" srcset=\"{}\" sizes=\"{}\" "
+        "width=\"{}\" height=\"{}\" alt=\"{}\" loading=\"{}\" "
+        "decoding=\"async\"></picture>",
+        alternatives,
+        css_class,
+        storage.url(largest["name"]),
+        _srcset(storage, fallback),
+        sizes,
+        largest["width"],
+        largest["height"],
+        alt,
+        loading,
+    )
+
+
+@register.simple_tag
+def avatar_src(profile, size):
+    """URL of ``profile``'s avatar for a ``size``-px slot, or the default."""
+    url = profile.avatar_url(size) if profile else None
+    return url or static(DEFAULT_AVATAR)
@@ -0,0 +1,48 @@
+"""Test helpers shared by the blog's test cases."""
+
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """Assert that a view stays within a fixed number of queries.
+
+    A budget is only useful if it holds at any size, so ``grow`` (which
+    should add more of whatever the view lists) is applied between two
+    measurements and the count must not change.
+    """
+
+    def count_queries(self, fetch, cold=True):
+        if cold:
+            cache.clear()
+            Site.objects.clear_cache()
+        with CaptureQueriesContext(connection) as ctx:
+            response = fetch()
+            if getattr(response, "streaming", False):
+                b"".join(response)
+        self.assertLess(response.status_code, 400, response)
+        return ctx.captured_queries
+
+    def assertQueryBudget(self, budget, fetch, grow=None, cold=True):
+        """``fetch()`` runs at most ``budget`` queries, before and after
+        ``grow()``. With ``cold`` the cache is cleared first, so page and
+        fragment caches (or the in-process ``Site`` cache) cannot hide a
+        query."""
+        queries = self.count_queries(fetch, cold)
+        self.assertLessEqual(len(queries), budget, self._listing(queries))
+        if grow is None:
+            return
+        grow()
+        grown = self.count_queries(fetch, cold)
+        self.assertEqual(
+            len(grown),
+            len(queries),
+            "Query count grows with the data:\n" + self._listing(grown),
+        )
+
+    def _listing(self, queries):
+        return "\n".join(
+            f"{i}. {q['sql']}" for i, q in enumerate(queries, start=1)
+        )
@@ -13,6 +13,11 @@ urlpatterns = [
     path("post/<slug:slug>/edit/", views.post_edit, name="post_edit"),
     path("post/<slug:slug>/delete/", views.post_delete, name="post_delete"),
     path("post/<slug:slug>/", views.post_detail, name="post_detail"),
+    path(
+        "post/<slug:slug>/comments/",
+        views.post_comments,
+        name="post_comments",
+    ),
     path("login/",  auth_views.LoginView.as_view(template_name="blog/login.html"), name="login"),
     path("logout/", auth_views.LogoutView.as_view(), name="logout"),
     path("register/", views.register, name="register"),
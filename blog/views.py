@@ -1,29 +1,81 @@
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
-from django.db.models import Q
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.templatetags.static import static
 from django.urls import reverse
+from django.utils.http import urlencode
 
+from . import search
+from .caching import cache_public_page
 from .forms import CommentForm, PostForm, ProfileForm, RegistrationForm
 from .models import Category, Comment, Post, Profile
+from .pagination import KeysetPaginator, OffsetPaginator, paginate
 
+POSTS_PER_PAGE = 6
+COMMENTS_PER_PAGE = 20
+COMMENT_AVATAR_SIZE = 112
 
+
+def _post_paginator(posts, q, count_cache_key):
+    """Keyset pages for listings; numbered pages for ranked search results."""
+    if q:
+        return OffsetPaginator(search.search(posts, q), POSTS_PER_PAGE)
+    return KeysetPaginator(
+        posts, POSTS_PER_PAGE, count_cache_key=count_cache_key
+    )
+
+
+def _post_lookup():
+    return Post.objects.select_related("author", "category")
+
+
+def _visible_post(request, slug):
+    """Fetch by the unique slug, then apply visibility rules in Python.
+
+    A single indexed lookup, rather than ``visible_to``'s set filter.
+    """
+    post = get_object_or_404(_post_lookup(), slug=slug)
+    if not post.is_visible_to(request.user):
+        raise Http404("No Post matches the given query.")
+    return post
+
+
+def _comment_paginator(post):
+    """Newest-first comments, one keyset page at a time (``?after=``)."""
+    return KeysetPaginator(
+        post.comments.select_related("author__profile"),
+        COMMENTS_PER_PAGE,
+        ordering=["-created_at", "-pk"],
+    )
+
+
+def _comment_links(post, page):
+    page.next_fragment_url = None
+    if page.has_next:
+        query = urlencode({"after": page.next_cursor})
+        page.next_url = f"{post.get_absolute_url()}?{query}#comments"
+        page.next_fragment_url = (
+            f"{reverse('blog:post_comments', args=[post.slug])}?{query}"
+        )
+    return page
+
+
+def _comment_page(request, post):
+    page = _comment_paginator(post).page(request.GET.get("after"))
+    return _comment_links(post, page)
+
+
+@cache_public_page
 def home(request):
-    posts = Post.objects.published()
+    posts = Post.objects.published().for_listing()
     q = (request.GET.get("q") or "").strip()
+    page_obj = paginate(
+        request, _post_paginator(posts, q, "blog:post-count:home")
+    )
     if q:
-        posts = posts.filter(Q(title__icontains=q) | Q(content__icontains=q))
-
-    paginator = Paginator(posts, 6)
-    page = request.GET.get("page", 1)
-    try:
-        page_obj = paginator.page(page)
-    except PageNotAnInteger:
-        page_obj = paginator.page(1)
-    except EmptyPage:
-        page_obj = paginator.page(paginator.num_pages)
+        page_obj.object_list = search.highlight(page_obj.object_list, q)
 
     return render(
         request,
@@ -36,64 +88,117 @@ def home(request):
     )
 
 
+def _add_comment(request, post):
+    """Handle a comment submission: a redirect, or ``None`` plus the form."""
+    if not request.user.is_authenticated:
+        messages.error(request, "Please log in to comment.")
+        login_url = f"{reverse('blog:login')}?next={request.path}"
+        return redirect(login_url), None
+
+    form = CommentForm(request.POST)
+    if form.is_valid():
+        c = form.save(commit=False)
+        c.post = post
+        c.author = request.user
+        c.save()
+        messages.success(request, "Comment published.")
+        return redirect(post.get_absolute_url()), None
+    return None, form
+
+
+@cache_public_page
 def post_detail(request, slug):
-    post = get_object_or_404(Post.objects.visible_to(request.user), slug=slug)
-    comments = post.comments.select_related("author").order_by("-created_at")
+    post = _visible_post(request, slug)
     form = CommentForm()
 
     is_preview = not post.is_public
 
     if request.method == "POST":
-        if not request.user.is_authenticated:
-            messages.error(request, "Please log in to comment.")
-            login_url = f"{reverse('blog:login')}?next={request.path}"
-            return redirect(login_url)
-
-        form = CommentForm(request.POST)
-        if form.is_valid():
-            c = form.save(commit=False)
-            c.post = post
-            c.author = request.user
-            c.save()
-            messages.success(request, "Comment published.")
-            return redirect(post.get_absolute_url())
+        response, form = _add_comment(request, post)
+        if response is not None:
+            return response
 
     return render(
         request,
         "blog/post_detail.html",
         {
             "post": post,
-            "comments": comments,
+            "comments": _comment_page(request, post),
+            "comment_count": post.comment_count,
             "form": form,
             "is_preview": is_preview,
         },
     )
 
 
+def _avatar_url(user, default, size=COMMENT_AVATAR_SIZE):
+    profile = getattr(user, "profile", None)
+    return (profile and profile.avatar_url(size)) or default
+
+
+def post_comments(request, slug):
+    """Next batch of comments as an HTML fragment, or JSON on request."""
+    post = _visible_post(request, slug)
+    page = _comment_page(request, post)
+
+    wants_json = request.GET.get("format") == "json" or (
+        "application/json" in request.headers.get("Accept", "")
+    )
+    if wants_json:
+        default_avatar = static("img/default-avatar.png")
+        return JsonResponse(
+            {
+                "comments": [
+                    {
+                        "id": c.pk,
+                        "author": c.author.username,
+                        "author_url": reverse(
+                            "blog:profile_detail", args=[c.author.username]
+                        ),
+                        "avatar": _avatar_url(c.author, default_avatar),
+                        "created_at": c.created_at.isoformat(),
+                        "content": c.content,
+                    }
+                    for c in page
+                ],
+                "next_cursor": page.next_cursor,
+                "next_url": page.next_fragment_url,
+            }
+        )
+
+    return render(
+        request,
+        "blog/partials/_comment_list.html",
+        {"post": post, "comments": page},
+    )
+
+
+@cache_public_page
 def category_list(request):
     cats = Category.objects.all()
     return render(request, "blog/category_list.html", {"categories": cats})
 
 
+@cache_public_page
 def category_detail(request, slug):
     category = get_object_or_404(Category, slug=slug)
 
-    posts_qs = Post.objects.published().filter(category=category)
+    posts_qs = Post.objects.published().for_listing().filter(category=category)
 
     q = (request.GET.get("q") or "").strip()
+    posts = paginate(
+        request,
+        _post_paginator(
+            posts_qs, q, f"blog:post-count:category:{category.pk}"
+        ),
+    )
     if q:
-        posts_qs = posts_qs.filter(
-            Q(title__icontains=q) | Q(content__icontains=q)
-        )
-
-    paginator = Paginator(posts_qs, 6)
-    page_number = request.GET.get("page")
-    posts = paginator.get_page(page_number)
+        posts.object_list = search.highlight(posts.object_list, q)
 
     return render(
         request,
         "blog/category_detail.html",
-        {"category": category, "posts": posts},
+        {"category": category, "posts": posts, "q": q},
     )
 
 
@@ -161,10 +266,15 @@ def profile_detail(request, username):
         User.objects.select_related("profile"),
         username=username,
     )
-    posts_qs = Post.objects.published().filter(author=user)
-    paginator = Paginator(posts_qs, 6)
-    page = request.GET.get("page")
-    posts = paginator.get_page(page)
+    posts_qs = Post.objects.published().for_listing().filter(author=user)
+    posts = paginate(
+        request,
+        KeysetPaginator(
+            posts_qs,
+            POSTS_PER_PAGE,
+            count_cache_key=f"blog:post-count:author:{user.pk}",
+        ),
+    )
     return render(
         request,
         "blog/profile_detail.html",
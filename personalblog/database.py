@@ -0,0 +1,50 @@
+"""Connection pool settings for Postgres.
+
+Every process (web worker or ``run_worker``) has its own pool, so the
+connections the server must allow add up to ``web_workers * max_size``
+plus the job workers' threads. ``pool_size`` splits a total budget
+between the web workers, and never gives a process more connections than
+it can use at once.
+
+Health checks come from ``CONN_HEALTH_CHECKS``: with a pool, Django turns
+it into ``ConnectionPool.check_connection`` on every checkout, so a dead
+connection (server restart, failover) is replaced rather than handed to a
+request.
+"""
+
+POOL_TIMEOUT = 10
+# Idle connections above min_size are closed after this long; every
+# connection is replaced after max_lifetime so server-side memory and
+# failovers don't stick to long-lived sessions.
+POOL_MAX_IDLE = 300
+POOL_MAX_LIFETIME = 1800
+
+
+def pool_size(web_workers, threads, max_connections, task_workers=0):
+    """Connections one web process may hold.
+
+    ``threads`` is how many requests a process serves at once: the
+    ``--threads`` of a sync worker, or for ASGI (where every request's
+    database work runs in a thread of its own) the concurrency it is
+    expected to sustain.
+    """
+    share = (max_connections - task_workers) // max(1, web_workers)
+    if share < 1:
+        raise ValueError(
+            f"{max_connections} connections can't serve {web_workers} web "
+            f"workers and {task_workers} job threads."
+        )
+    return max(1, min(threads, share))
+
+
+def pool_options(max_size, timeout=POOL_TIMEOUT, name="default"):
+    """``DATABASES[...]["OPTIONS"]["pool"]`` for Django's psycopg pool."""
+    return {
+        "min_size": 1,
+        "max_size": max_size,
+        # Seconds a request waits for a free connection before failing.
+        "timeout": timeout,
+        "max_idle": POOL_MAX_IDLE,
+        "max_lifetime": POOL_MAX_LIFETIME,
+        "name": name,
+    }
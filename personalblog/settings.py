@@ -4,6 +4,8 @@ from dotenv import load_dotenv
 import dj_database_url
 import cloudinary
 
+from .database import pool_options, pool_size
+
 load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -47,11 +49,17 @@ SITE_ID = 1
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "blog.middleware.AsyncWhiteNoiseMiddleware",
+    "blog.middleware.ServerTimingMiddleware",
+    "blog.middleware.AssetPreloadMiddleware",
+    "blog.middleware.QueryBudgetMiddleware",
+    "blog.middleware.ProfilingMiddleware",
+    "blog.middleware.ReplicaMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "blog.middleware.SessionlessAnonymousMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -79,9 +87,103 @@ DATABASES = {
     "default": dj_database_url.config(
         default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
         conn_max_age=600,
+        conn_health_checks=True,
     )
 }
 
+REDIS_URL = os.getenv("REDIS_URL")
+
+CACHES = {
+    "default": (
+        {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+        if REDIS_URL
+        else {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "personalblog",
+        }
+    )
+}
+
+# Sessions are read from the cache and written through to the database
+# ("cached_db"), but only with a cache every worker shares: with a
+# per-process LocMemCache, a worker would keep serving a session another
+# worker has logged out. Anonymous visitors have no session to read.
+SESSION_ENGINE = (
+    "django.contrib.sessions.backends.cached_db"
+    if REDIS_URL
+    else "django.contrib.sessions.backends.db"
+)
+# Flash messages travel in a signed cookie, never in the session.
+MESSAGE_STORAGE = "django.contrib.messages.storage.cookie.CookieStorage"
+
+# blog.tasks: background jobs are queued in the database and run by
+# `manage.py run_worker`; eager mode runs them in-process after commit.
+BLOG_TASKS_EAGER = env_bool("BLOG_TASKS_EAGER", "false")
+BLOG_TASK_WORKERS = int(os.getenv("BLOG_TASK_WORKERS", "2"))
+
+# Read replicas: DATABASE_REPLICA_URLS is a comma-separated list of
+# database URLs (same format as DATABASE_URL). Safe requests read posts,
+# categories, comments and profiles from them; see blog/replicas.py.
+# Locally, a copy of db.sqlite3 works as a replica that never catches up.
+BLOG_READ_REPLICAS = []
+for number, url in enumerate(
+    filter(None, map(str.strip, os.getenv("DATABASE_REPLICA_URLS", "").split(","))),
+    start=1,
+):
+    alias = f"replica{number}"
+    DATABASES[alias] = dj_database_url.parse(
+        url, conn_max_age=600, conn_health_checks=True
+    )
+    # Tests create no database for it and read the primary's.
+    DATABASES[alias]["TEST"] = {"MIRROR": "default"}
+    BLOG_READ_REPLICAS.append(alias)
+DATABASE_ROUTERS = ["blog.replicas.ReplicaRouter"]
+# Replicas further behind are skipped; browsers that just wrote read from
+# the primary for this long (plus the lag check interval).
+BLOG_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DATABASE_REPLICA_MAX_LAG", "5"))
+
+# Postgres connections come from a psycopg pool in each process instead of
+# one persistent connection per thread (see personalblog/database.py).
+# WEB_CONCURRENCY and WEB_THREADS are the gunicorn worker count (gunicorn
+# reads it itself) and its --threads (the Procfile passes it): how many web
+# processes run and how many requests each serves at once. A sync worker
+# serves one. DB_MAX_CONNECTIONS is what the server allows us in total.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+WEB_THREADS = int(os.getenv("WEB_THREADS", "1"))
+for alias, database in DATABASES.items():
+    if database["ENGINE"] != "django.db.backends.postgresql" or not env_bool(
+        "DB_POOL", "true"
+    ):
+        continue
+    database["CONN_MAX_AGE"] = 0  # Pooling replaces persistence.
+    database.setdefault("OPTIONS", {})["pool"] = pool_options(
+        int(os.getenv("DB_POOL_SIZE", "0"))
+        or pool_size(
+            WEB_CONCURRENCY,
+            WEB_THREADS,
+            int(os.getenv("DB_MAX_CONNECTIONS", "20")),
+            task_workers=BLOG_TASK_WORKERS,
+        ),
+        timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        name=alias,
+    )
+# Requests over either budget are logged to "blog.queries".
+BLOG_QUERY_BUDGET = int(os.getenv("BLOG_QUERY_BUDGET", "25"))
+BLOG_QUERY_TIME_BUDGET_MS = int(os.getenv("BLOG_QUERY_TIME_BUDGET_MS", "250"))
+# Server-Timing headers (db/template/storage/total) on every response. They
+# tell anyone how long queries take, so only on by default in development.
+BLOG_SERVER_TIMING = env_bool("BLOG_SERVER_TIMING", "true" if DEBUG else "false")
+# Profiles of a sampled fraction of requests (cProfile) and of requests over
+# BLOG_PROFILE_SLOW_MS (stack sampling); both off by default. Read them with
+# `manage.py profile_report`.
+BLOG_PROFILE_SAMPLE_RATE = float(os.getenv("BLOG_PROFILE_SAMPLE_RATE", "0"))
+BLOG_PROFILE_SLOW_MS = int(os.getenv("BLOG_PROFILE_SLOW_MS", "0"))
+BLOG_PROFILE_INTERVAL_MS = int(os.getenv("BLOG_PROFILE_INTERVAL_MS", "5"))
+BLOG_PROFILE_DIR = os.getenv("BLOG_PROFILE_DIR", str(BASE_DIR / "profiles"))
+
 LANGUAGE_CODE = "en-us"
 TIME_ZONE = "UTC"
 USE_I18N = True
@@ -96,7 +198,11 @@ MEDIA_ROOT = BASE_DIR / "media"
 
 STORAGES = {
     "default": {"BACKEND": "cloudinary_storage.storage.MediaCloudinaryStorage"},
-    "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
+    # Minifies CSS/JS, then WhiteNoise hashes and gzip/Brotli-compresses.
+    "staticfiles": {"BACKEND": "blog.assets.MinifiedStorage"},
+    # Uploads wait in the database until a worker moves them to "default"
+    # (blog.media); the worker need not share the web process's disk.
+    "staging": {"BACKEND": "blog.media.DatabaseStagingStorage"},
 }
 
 CLOUDINARY_STORAGE = {
@@ -113,12 +219,18 @@ cloudinary.config(
 )
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+TEST_RUNNER = "personalblog.test_runner.TestRunner"
 
 LOGIN_REDIRECT_URL = "blog:home"
 LOGOUT_REDIRECT_URL = "blog:home"
 LOGIN_URL = "blog:login"
 
-EMAIL_BACKEND = "anymail.backends.brevo.EmailBackend"
+# Mail is queued in the database (blog.mail) and handed to the real
+# provider by the background worker.
+EMAIL_BACKEND = "blog.mail.OutboxEmailBackend"
+OUTBOX_DELIVERY_BACKEND = os.getenv(
+    "OUTBOX_DELIVERY_BACKEND", "anymail.backends.brevo.EmailBackend"
+)
 ANYMAIL = {"BREVO_API_KEY": os.getenv("BREVO_API_KEY")}
 
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "Blurry Shady <roruow5@gmail.com>")
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+# Each test holds a connection in its transaction while worker threads
+# (run_worker, bench_db_pool) check out their own.
+TEST_POOL_SIZE = 4
+
+
+class TestRunner(DiscoverRunner):
+    """Run tests without ``collectstatic`` output, with room in the pools.
+
+    The manifest storage only knows files that ``collectstatic`` has
+    hashed; tests serve the source files under their own names instead.
+    Connection pools are sized for one request at a time per web worker,
+    which a test that starts threads outgrows.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.STORAGES = {
+            **settings.STORAGES,
+            "staticfiles": {
+                "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+            },
+        }
+        for database in settings.DATABASES.values():
+            pool = database.get("OPTIONS", {}).get("pool")
+            if isinstance(pool, dict):
+                pool["max_size"] = max(pool["max_size"], TEST_POOL_SIZE)
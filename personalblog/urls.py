@@ -18,9 +18,14 @@ Including another URLconf
 # personalblog/urls.py
 from django.contrib import admin
 from django.urls import path, include
-from django.contrib.sitemaps.views import sitemap
+from django.contrib.sitemaps.views import index as sitemap_index
 from django.views.generic import TemplateView
-from blog.sitemaps import PostSitemap, CategorySitemap, StaticSitemap
+from blog.sitemaps import (
+    CategorySitemap,
+    PostSitemap,
+    StaticSitemap,
+    cached_sitemap,
+)
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
@@ -57,7 +62,13 @@ urlpatterns = [
         name="password_reset_complete",
     ),
 
-    path("sitemap.xml", sitemap, {"sitemaps": sitemaps}, name="sitemap"),
+    path("sitemap.xml", sitemap_index, {"sitemaps": sitemaps}, name="sitemap"),
+    path(
+        "sitemap-<section>.xml",
+        cached_sitemap,
+        {"sitemaps": sitemaps},
+        name="django.contrib.sitemaps.views.sitemap",
+    ),
     path(
         "robots.txt",
         TemplateView.as_view(template_name="robots.txt", content_type="text/plain"),
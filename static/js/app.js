@@ -39,6 +39,30 @@
   });
 })();
 
+// ---------------- Load more comments ----------------
+(() => {
+  document.addEventListener("click", async (e) => {
+    const btn = e.target.closest("a[data-comments-more]");
+    if (!btn || !btn.dataset.commentsMore) return;
+    e.preventDefault();
+    if (btn.dataset.loading) return;
+    btn.dataset.loading = "1";
+
+    try {
+      const resp = await fetch(btn.dataset.commentsMore, {
+        headers: { "Accept": "text/html" },
+        credentials: "same-origin",
+      });
+      if (!resp.ok) throw new Error(resp.statusText);
+      btn.insertAdjacentHTML("afterend", await resp.text());
+      btn.remove();
+    } catch {
+      // Fall back to the full-page link.
+      window.location.href = btn.href;
+    }
+  });
+})();
+
 // ---------------- Starfield + eclipse (unchanged) ----------------
 (() => {
   const cnv = document.getElementById("bg-stars");